@@ -0,0 +1,423 @@
+#!/usr/bin/env python3
+"""Local stand-in for the Home Assistant Supervisor core API.
+
+Serves ``/core/api/states`` with a configurable number of entities, of which
+a configurable number are ``climate.*``, and simulates latency and failures
+of ``/core/api/services/climate/set_temperature``. ``/core/api/template``
+answers the add-on's climate template with the output Home Assistant would
+render (it does not evaluate Jinja), unless started with ``--no-template``.
+With ``--websocket`` it also serves ``/core/websocket``: the auth handshake,
+``subscribe_events`` for ``state_changed`` and ``ping``. Every change to a
+climate entity is pushed to the subscribers; ``drop_websockets`` cuts them
+off so the add-on has to reconnect and resync.
+
+Run standalone:
+
+    python3 benchmark/fake_supervisor.py --entities 5000 --climate 40 --latency-ms 150
+"""
+
+import argparse
+import base64
+import hashlib
+import json
+import random
+import struct
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+API_PREFIX = "/core/api"
+WEBSOCKET_PATH = "/core/websocket"
+# Token the WebSocket API accepts
+TOKEN = "benchmark"
+
+WS_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+WS_TEXT, WS_CLOSE, WS_PING, WS_PONG = 0x1, 0x8, 0x9, 0xA
+
+
+def now_iso():
+    return datetime.now(timezone.utc).isoformat()
+
+
+def climate_state(index):
+    entity_id = f"climate.raum_{index:04d}"
+    return {
+        "entity_id": entity_id,
+        "state": random.choice(["heat", "auto", "off"]),
+        "attributes": {
+            "hvac_modes": ["auto", "heat", "off"],
+            "min_temp": 5.0,
+            "max_temp": 30.0,
+            "target_temp_step": 0.5,
+            "preset_modes": ["boost", "eco", "none"],
+            "current_temperature": round(random.uniform(16, 23), 1),
+            "temperature": random.choice([17.0, 18.0, 19.5, 20.0, 21.0, 22.0]),
+            "current_humidity": random.randint(35, 60),
+            "preset_mode": "none",
+            "valve_position": random.randint(0, 100),
+            "friendly_name": f"Raum {index:04d}",
+            "supported_features": 401,
+        },
+        "last_changed": "2024-01-01T00:00:00.000000+00:00",
+        "last_updated": "2024-01-01T00:00:00.000000+00:00",
+        "context": {"id": f"{index:026d}", "parent_id": None, "user_id": None},
+    }
+
+
+def other_state(index):
+    kind = index % 4
+    if kind == 0:
+        entity_id = f"sensor.messwert_{index:05d}"
+        attributes = {
+            "state_class": "measurement",
+            "unit_of_measurement": "W",
+            "device_class": "power",
+            "friendly_name": f"Messwert {index}",
+        }
+    elif kind == 1:
+        entity_id = f"binary_sensor.kontakt_{index:05d}"
+        attributes = {"device_class": "window", "friendly_name": f"Kontakt {index}"}
+    elif kind == 2:
+        entity_id = f"automation.regel_{index:05d}"
+        attributes = {
+            "id": str(index),
+            "last_triggered": "2024-01-01T00:00:00.000000+00:00",
+            "mode": "single",
+            "current": 0,
+            "friendly_name": f"Regel {index} {{\"verschachtelt\": [1, 2]}}",
+        }
+    else:
+        entity_id = f"light.licht_{index:05d}"
+        attributes = {
+            "supported_color_modes": ["brightness", "color_temp"],
+            "color_mode": "brightness",
+            "brightness": 128,
+            "friendly_name": f"Licht {index}",
+            "supported_features": 40,
+        }
+    return {
+        "entity_id": entity_id,
+        "state": "on",
+        "attributes": attributes,
+        "last_changed": "2024-01-01T00:00:00.000000+00:00",
+        "last_updated": "2024-01-01T00:00:00.000000+00:00",
+        "context": {"id": f"{index:026d}", "parent_id": None, "user_id": None},
+    }
+
+
+class FakeWebSocket:
+    """Server side of one WebSocket connection (RFC 6455, text frames only)."""
+
+    def __init__(self, rfile, wfile):
+        self.rfile = rfile
+        self.wfile = wfile
+        self.send_lock = threading.Lock()
+        self.subscription = None
+        self.closed = False
+
+    def recv(self):
+        """Return the next text message, or None once the client closes."""
+        while True:
+            header = self.rfile.read(2)
+            if len(header) < 2:
+                return None
+            opcode = header[0] & 0x0F
+            length = header[1] & 0x7F
+            if length == 126:
+                length = struct.unpack("!H", self.rfile.read(2))[0]
+            elif length == 127:
+                length = struct.unpack("!Q", self.rfile.read(8))[0]
+            mask = self.rfile.read(4) if header[1] & 0x80 else None
+            payload = self.rfile.read(length)
+            if mask:
+                payload = bytes(b ^ mask[i % 4] for i, b in enumerate(payload))
+            if opcode == WS_TEXT:
+                return payload.decode()
+            if opcode == WS_PING:
+                self._frame(WS_PONG, payload)
+            elif opcode == WS_CLOSE:
+                return None
+
+    def send(self, message):
+        self._frame(WS_TEXT, json.dumps(message).encode())
+
+    def close(self):
+        try:
+            self._frame(WS_CLOSE, b"")
+        except (OSError, ValueError):
+            # Already closed by the handler thread
+            pass
+        self.closed = True
+
+    def _frame(self, opcode, payload):
+        if len(payload) < 126:
+            header = struct.pack("!BB", 0x80 | opcode, len(payload))
+        elif len(payload) < 1 << 16:
+            header = struct.pack("!BBH", 0x80 | opcode, 126, len(payload))
+        else:
+            header = struct.pack("!BBQ", 0x80 | opcode, 127, len(payload))
+        with self.send_lock:
+            if self.closed:
+                return
+            self.wfile.write(header + payload)
+
+
+class FakeSupervisor:
+    """State and behaviour of the fake API, shared by all handler threads."""
+
+    def __init__(self, entities=1000, climate=40, latency_ms=0.0, failure_rate=0.0,
+                 template=True, seed=1, websocket=False):
+        random.seed(seed)
+        self.template = template
+        self.websocket = websocket
+        self.websockets = set()
+        climate = min(climate, entities)
+        self.latency = latency_ms / 1000
+        self.failure_rate = failure_rate
+        self.lock = threading.Lock()
+        self.climate = {}
+        for i in range(climate):
+            state = climate_state(i)
+            self.climate[state["entity_id"]] = state
+        self.others = [other_state(i) for i in range(entities - climate)]
+        self.service_calls = 0
+        self.states_requests = 0
+        self.template_requests = 0
+        self.websocket_connections = 0
+
+    def states(self):
+        # Interleave climate entities with the rest, like a real registry
+        with self.lock:
+            climate = list(self.climate.values())
+        step = max(1, len(self.others) // max(1, len(climate)))
+        result = []
+        placed = 0
+        for i, other in enumerate(self.others):
+            if i % step == 0 and placed < len(climate):
+                result.append(climate[placed])
+                placed += 1
+            result.append(other)
+        result.extend(climate[placed:])
+        return result
+
+    def render_climate_template(self):
+        with self.lock:
+            climate = list(self.climate.values())
+        return [
+            {
+                "entity_id": state["entity_id"],
+                "name": state["attributes"].get("friendly_name", state["entity_id"]),
+                "current_temperature": state["attributes"].get("current_temperature"),
+                "target_temperature": state["attributes"].get("temperature"),
+                "min_temp": state["attributes"].get("min_temp", 5),
+                "max_temp": state["attributes"].get("max_temp", 30),
+                "hvac_mode": state["state"],
+                "target_temp_step": state["attributes"].get("target_temp_step"),
+                "last_updated": state["last_updated"],
+            }
+            for state in climate
+        ]
+
+    def set_temperature(self, body):
+        time.sleep(self.latency)
+        with self.lock:
+            self.service_calls += 1
+        if random.random() < self.failure_rate:
+            return False
+        entity_ids = body.get("entity_id")
+        if isinstance(entity_ids, str):
+            entity_ids = [entity_ids]
+        for entity_id in entity_ids:
+            self.update_climate(entity_id, temperature=body["temperature"])
+        return True
+
+    def update_climate(self, entity_id, notify=True, **attributes):
+        """Change attributes of a climate entity and push the state_changed event.
+
+        With ``notify=False`` the change is silent, as if the event was lost
+        while the add-on was disconnected.
+        """
+        with self.lock:
+            old_state = self.climate.get(entity_id)
+            if old_state is None:
+                return
+            state = json.loads(json.dumps(old_state))
+            state["attributes"].update(attributes)
+            state["last_changed"] = state["last_updated"] = now_iso()
+            self.climate[entity_id] = state
+        if notify:
+            self.publish(entity_id, old_state, state)
+
+    def remove_climate(self, entity_id):
+        with self.lock:
+            old_state = self.climate.pop(entity_id, None)
+        if old_state is not None:
+            self.publish(entity_id, old_state, None)
+
+    def publish(self, entity_id, old_state, new_state):
+        """Send a state_changed event to every subscribed WebSocket."""
+        event = {
+            "event_type": "state_changed",
+            "data": {"entity_id": entity_id, "old_state": old_state, "new_state": new_state},
+            "origin": "LOCAL",
+            "time_fired": now_iso(),
+        }
+        for ws in list(self.websockets):
+            if ws.subscription is not None:
+                try:
+                    ws.send({"id": ws.subscription, "type": "event", "event": event})
+                except (OSError, ValueError):
+                    self.websockets.discard(ws)
+
+    def drop_websockets(self):
+        """Close every WebSocket connection, like a Core restart would."""
+        for ws in list(self.websockets):
+            ws.close()
+            self.websockets.discard(ws)
+
+    def serve_websocket(self, ws):
+        """Run the Home Assistant WebSocket API subset the add-on uses."""
+        ws.send({"type": "auth_required", "ha_version": "2024.1.0"})
+        message = ws.recv()
+        if message is None:
+            return
+        auth = json.loads(message)
+        if auth.get("type") != "auth" or auth.get("access_token") != TOKEN:
+            ws.send({"type": "auth_invalid", "message": "Invalid access token or password"})
+            return
+        ws.send({"type": "auth_ok", "ha_version": "2024.1.0"})
+        with self.lock:
+            self.websocket_connections += 1
+        self.websockets.add(ws)
+        try:
+            while not ws.closed:
+                message = ws.recv()
+                if message is None:
+                    break
+                request = json.loads(message)
+                if request.get("type") == "subscribe_events":
+                    ws.subscription = request["id"]
+                    ws.send({"id": request["id"], "type": "result", "success": True, "result": None})
+                elif request.get("type") == "ping":
+                    ws.send({"id": request["id"], "type": "pong"})
+                else:
+                    ws.send({
+                        "id": request.get("id"), "type": "result", "success": False,
+                        "error": {"code": "unknown_command", "message": "Unknown command."},
+                    })
+        finally:
+            self.websockets.discard(ws)
+
+
+def make_handler(fake):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        # Headers and body go out in separate writes; without TCP_NODELAY
+        # delayed ACKs add ~40 ms to every response
+        disable_nagle_algorithm = True
+
+        def log_message(self, fmt, *args):
+            pass
+
+        def _send_json(self, status, payload):
+            body = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _read_json(self):
+            length = int(self.headers.get("Content-Length", 0))
+            return json.loads(self.rfile.read(length) or b"{}")
+
+        def _websocket(self):
+            key = self.headers.get("Sec-WebSocket-Key", "")
+            accept = base64.b64encode(hashlib.sha1((key + WS_GUID).encode()).digest()).decode()
+            self.send_response(101, "Switching Protocols")
+            self.send_header("Upgrade", "websocket")
+            self.send_header("Connection", "Upgrade")
+            self.send_header("Sec-WebSocket-Accept", accept)
+            self.end_headers()
+            self.wfile.flush()
+            self.close_connection = True
+            fake.serve_websocket(FakeWebSocket(self.rfile, self.wfile))
+
+        def do_GET(self):
+            if (
+                self.path == WEBSOCKET_PATH
+                and fake.websocket
+                and self.headers.get("Upgrade", "").lower() == "websocket"
+            ):
+                self._websocket()
+            elif self.path == f"{API_PREFIX}/states":
+                fake.states_requests += 1
+                self._send_json(200, fake.states())
+            elif self.path.startswith(f"{API_PREFIX}/states/"):
+                entity_id = self.path[len(f"{API_PREFIX}/states/"):]
+                state = fake.climate.get(entity_id)
+                if state is None:
+                    self._send_json(404, {"message": "Entity not found."})
+                else:
+                    self._send_json(200, state)
+            else:
+                self._send_json(404, {"message": "Not found"})
+
+        def do_POST(self):
+            body = self._read_json()
+            if self.path == f"{API_PREFIX}/services/climate/set_temperature":
+                if fake.set_temperature(body):
+                    self._send_json(200, [])
+                else:
+                    self._send_json(502, {"message": "Bad Gateway"})
+            elif self.path == f"{API_PREFIX}/template" and fake.template:
+                fake.template_requests += 1
+                rendered = json.dumps(fake.render_climate_template()).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; charset=utf-8")
+                self.send_header("Content-Length", str(len(rendered)))
+                self.end_headers()
+                self.wfile.write(rendered)
+            else:
+                self._send_json(404, {"message": "Not found"})
+
+    return Handler
+
+
+def start(fake, host="127.0.0.1", port=0):
+    """Start serving ``fake`` in a background thread and return the server."""
+    server = ThreadingHTTPServer((host, port), make_handler(fake))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="fake-supervisor", daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8099)
+    parser.add_argument("--entities", type=int, default=1000)
+    parser.add_argument("--climate", type=int, default=40)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--no-template", action="store_true", help="answer /template with 404")
+    parser.add_argument("--websocket", action="store_true", help=f"serve {WEBSOCKET_PATH}")
+    args = parser.parse_args()
+
+    fake = FakeSupervisor(
+        args.entities, args.climate, args.latency_ms, args.failure_rate, not args.no_template,
+        websocket=args.websocket,
+    )
+    server = start(fake, args.host, args.port)
+    print(f"Fake Supervisor: http://{args.host}:{server.server_port}{API_PREFIX}")
+    if args.websocket:
+        print(f"WebSocket: ws://{args.host}:{server.server_port}{WEBSOCKET_PATH} (Token {TOKEN})")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
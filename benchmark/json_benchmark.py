@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""Compare stdlib json and orjson on the add-on's typical JSON payloads.
+
+Payloads are built with ``fake_supervisor``: the /api/thermostats response,
+the full /states body as received from Home Assistant, a single climate state
+(what the streaming parser decodes per entity) and the originals file.
+
+    python3 benchmark/json_benchmark.py --entities 5000 --climate 200
+"""
+
+import argparse
+import json
+import sys
+import timeit
+
+import fake_supervisor
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def thermostats_response(fake):
+    return {
+        "success": True,
+        "thermostats": [
+            {
+                "entity_id": state["entity_id"],
+                "name": state["attributes"]["friendly_name"],
+                "current_temperature": state["attributes"]["current_temperature"],
+                "target_temperature": state["attributes"]["temperature"],
+                "hvac_mode": state["state"],
+                "original_temperature": 20.0,
+            }
+            for state in fake.climate.values()
+        ],
+    }
+
+
+def backends():
+    result = {
+        "json": (
+            lambda obj: json.dumps(obj, sort_keys=True, separators=(",", ":")),
+            json.loads,
+        ),
+    }
+    if orjson is not None:
+        result["orjson"] = (
+            lambda obj: orjson.dumps(obj, option=orjson.OPT_SORT_KEYS),
+            orjson.loads,
+        )
+    return result
+
+
+def best_of(fn, number, repeat=5):
+    """Fastest time per call in microseconds."""
+    return min(timeit.repeat(fn, number=number, repeat=repeat)) / number * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--entities", type=int, default=5000)
+    parser.add_argument("--climate", type=int, default=200)
+    parser.add_argument("--number", type=int, default=20, help="calls per timing run")
+    args = parser.parse_args()
+
+    fake = fake_supervisor.FakeSupervisor(args.entities, args.climate)
+    states_body = json.dumps(fake.states()).encode()
+    one_state = json.dumps(next(iter(fake.climate.values())))
+    payloads = {
+        "thermostats_response": thermostats_response(fake),
+        "originals_file": {entity_id: 20.5 for entity_id in fake.climate},
+    }
+
+    if orjson is None:
+        print("orjson ist nicht installiert, messe nur json", file=sys.stderr)
+
+    report = {"entities": args.entities, "climate": args.climate, "results": []}
+    for name, (dumps, loads) in backends().items():
+        row = {"backend": name}
+        for payload_name, payload in payloads.items():
+            row[f"encode_{payload_name}_us"] = round(best_of(lambda: dumps(payload), args.number), 1)
+        row["decode_states_body_us"] = round(best_of(lambda: loads(states_body), args.number), 1)
+        row["decode_one_state_us"] = round(best_of(lambda: loads(one_state), args.number * 100), 2)
+        report["results"].append(row)
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""Compare the write planners with the previous multi-pass code.
+
+Plans an offset over a fixture of climate entities, once for all of them and
+once for a small selection, and reports time per request. ``legacy_offset``
+reproduces the endpoint code before ``write_plan``: selection filter,
+originals loop, targets loop and a separate no-op split. For the whole
+fleet the columnar planner (``setpoint_columns``) is measured as well, with
+its columns prebuilt as the app caches them, and their build time separately.
+
+    python3 benchmark/plan_benchmark.py --entities 1000
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "rootfs", "app"))
+
+import setpoint_columns  # noqa: E402
+from write_plan import plan_writes, split_noop_targets  # noqa: E402
+
+
+def make_entities(count, seed=1):
+    rng = random.Random(seed)
+    return [
+        {
+            "entity_id": f"climate.raum_{i:04d}",
+            "name": f"Raum {i:04d}",
+            "current_temperature": round(rng.uniform(16, 23), 1),
+            "target_temperature": rng.choice([17.0, 18.0, 19.5, 20.0, 21.0, 29.5, None]),
+            "min_temp": 5.0,
+            "max_temp": 30.0,
+            "hvac_mode": rng.choice(["heat", "auto", "off"]),
+            "target_temp_step": 0.5,
+            "last_updated": "2024-01-01T00:00:00+00:00",
+        }
+        for i in range(count)
+    ]
+
+
+def legacy_offset(entities, originals, selected_ids, offset):
+    if selected_ids:
+        selected_set = set(selected_ids)
+        target_entities = [e for e in entities if e["entity_id"] in selected_set]
+    else:
+        target_entities = entities
+
+    originals = dict(originals)
+    for entity in target_entities:
+        if entity["target_temperature"] is not None and entity["entity_id"] not in originals:
+            originals[entity["entity_id"]] = entity["target_temperature"]
+
+    targets = []
+    for entity in target_entities:
+        if entity["target_temperature"] is None:
+            continue
+        new_temp = entity["target_temperature"] + offset
+        new_temp = max(entity["min_temp"], min(entity["max_temp"], new_temp))
+        targets.append((entity["entity_id"], new_temp))
+
+    return split_noop_targets(targets, {e["entity_id"]: e for e in target_entities})
+
+
+def planned_offset(entities_by_id, originals, selected_ids, offset):
+    # The app looks selections up by entity_id (lookup_entities)
+    entities = [entities_by_id[eid] for eid in selected_ids] if selected_ids else entities_by_id.values()
+    plan = plan_writes(
+        entities,
+        originals,
+        lambda e: e["target_temperature"] + offset if e["target_temperature"] is not None else None,
+    )
+    return plan.targets, plan.skipped
+
+
+def best_of(fn, number, repeat=5):
+    """Fastest time per call in microseconds."""
+    return min(timeit.repeat(fn, number=number, repeat=repeat)) / number * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--entities", type=int, default=1000)
+    parser.add_argument("--selected", type=int, default=10, help="size of the small selection")
+    parser.add_argument("--number", type=int, default=50, help="calls per timing run")
+    args = parser.parse_args()
+
+    entities = make_entities(args.entities)
+    entities_by_id = {e["entity_id"]: e for e in entities}
+    originals = {e["entity_id"]: 20.0 for e in entities[::2]}
+    selection = [e["entity_id"] for e in entities[:: max(1, len(entities) // args.selected)]][:args.selected]
+
+    report = {
+        "entities": args.entities,
+        "selected": len(selection),
+        "columns_backend": setpoint_columns.BACKEND,
+        "results": [],
+    }
+    for name, selected_ids in (("all", None), ("selection", selection)):
+        legacy = legacy_offset(entities, originals, selected_ids, 1.0)
+        planned = planned_offset(entities_by_id, originals, selected_ids, 1.0)
+        assert legacy == planned, "planner disagrees with the legacy code"
+        report["results"].append({
+            "scenario": name,
+            "legacy_us": round(best_of(lambda: legacy_offset(entities, originals, selected_ids, 1.0), args.number), 1),
+            "planned_us": round(best_of(lambda: planned_offset(entities_by_id, originals, selected_ids, 1.0), args.number), 1),
+        })
+
+    columns = setpoint_columns.SetpointColumns(entities)
+    assert columns.plan(offset=1.0) == legacy_offset(entities, originals, None, 1.0)
+    report["results"].append({
+        "scenario": "all_columnar",
+        "columns_build_us": round(best_of(lambda: setpoint_columns.SetpointColumns(entities), args.number), 1),
+        "planned_us": round(best_of(
+            lambda: setpoint_columns.plan_from_columns(columns, originals, offset=1.0), args.number
+        ), 1),
+        "plan_only_us": round(best_of(lambda: columns.plan(offset=1.0), args.number), 1),
+    })
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+"""Benchmark the add-on API against a local fake Supervisor.
+
+Starts ``fake_supervisor`` in-process, launches ``rootfs/app/main.py`` as a
+subprocess pointed at it (``SUPERVISOR_URL``, ``DATA_DIR`` in a temporary
+directory) and measures latency and throughput of the main endpoints. Results
+are written as JSON, one object per scenario and entity count.
+
+    python3 benchmark/run_benchmark.py --entities 100 1000 20000 --output bench.json
+
+Compare fetch paths with ``--option states_fetch='"states"'`` (full /states
+list) against the default template path. The suite runs with the shared
+states cache off (``states_cache_ttl=0``) so every ``/api/thermostats`` call
+reaches the fake Supervisor; ``thermostats_cached`` measures the same call
+in a second run with the add-on's default cache TTL. With ``--websocket`` the
+fake serves the WebSocket API too, and the add-on answers from its
+WebSocket-fed state cache as in production.
+"""
+
+import argparse
+import itertools
+import json
+import os
+import platform
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+import fake_supervisor
+
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "rootfs", "app", "main.py")
+
+# states_cache_ttl for the thermostats_cached scenario (the add-on default)
+CACHED_TTL = 2
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_app(supervisor_port, data_dir, options):
+    with open(os.path.join(data_dir, "options.json"), "w") as f:
+        json.dump(options, f)
+    port = free_port()
+    env = dict(
+        os.environ,
+        SUPERVISOR_URL=f"http://127.0.0.1:{supervisor_port}{fake_supervisor.API_PREFIX}",
+        SUPERVISOR_WS_URL=f"ws://127.0.0.1:{supervisor_port}{fake_supervisor.WEBSOCKET_PATH}",
+        SUPERVISOR_TOKEN=fake_supervisor.TOKEN,
+        DATA_DIR=data_dir,
+        PORT=str(port),
+    )
+    proc = subprocess.Popen(
+        [sys.executable, APP_PATH],
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            requests.get(f"{base_url}/api/status", timeout=1)
+            return proc, base_url
+        except requests.ConnectionError:
+            time.sleep(0.1)
+    proc.terminate()
+    raise RuntimeError("App did not start within 30 s")
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def measure(name, call, iterations, concurrency):
+    """Run ``call`` ``iterations`` times with ``concurrency`` parallel clients."""
+    session = requests.Session()
+
+    def one(_):
+        started = time.perf_counter()
+        resp = call(session)
+        elapsed = time.perf_counter() - started
+        ok = resp.status_code < 400 and resp.json().get("success", False)
+        return elapsed, ok
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(one, range(iterations)))
+    wall = time.perf_counter() - started
+
+    latencies = [r[0] for r in results]
+    return {
+        "scenario": name,
+        "iterations": iterations,
+        "concurrency": concurrency,
+        "errors": sum(1 for r in results if not r[1]),
+        "throughput_rps": round(iterations / wall, 2),
+        "latency_ms": {
+            "mean": round(statistics.mean(latencies) * 1000, 2),
+            "p50": round(percentile(latencies, 50) * 1000, 2),
+            "p95": round(percentile(latencies, 95) * 1000, 2),
+            "max": round(max(latencies) * 1000, 2),
+        },
+    }
+
+
+def measure_thermostats(name, base_url, iterations, concurrency):
+    url = base_url + "/api/thermostats"
+    return measure(name, lambda s: s.get(url), iterations, concurrency)
+
+
+def run_suite(base_url, iterations, concurrency):
+    url = base_url + "/api"
+    results = [
+        measure_thermostats("thermostats", base_url, iterations, concurrency),
+        # Alternate the target, or every write after the first would be
+        # skipped as already set
+        measure(
+            "set_temperature",
+            lambda s, temps=itertools.cycle((18, 19)): s.post(
+                f"{url}/set_temperature", json={"temperature": next(temps)}
+            ),
+            iterations,
+            1,
+        ),
+    ]
+
+    # apply_offset and restore only make sense as pairs
+    timings = {"apply_offset": [], "restore": []}
+    errors = {"apply_offset": 0, "restore": 0}
+    session = requests.Session()
+    for _ in range(iterations):
+        for name, body in (("apply_offset", {"offset": 1}), ("restore", {})):
+            started = time.perf_counter()
+            resp = session.post(f"{url}/{name}", json=body)
+            timings[name].append(time.perf_counter() - started)
+            if resp.status_code >= 400 or not resp.json().get("success", False):
+                errors[name] += 1
+    for name, times in timings.items():
+        results.append({
+            "scenario": name,
+            "iterations": iterations,
+            "concurrency": 1,
+            "errors": errors[name],
+            "throughput_rps": round(len(times) / sum(times), 2),
+            "latency_ms": {
+                "mean": round(statistics.mean(times) * 1000, 2),
+                "p50": round(percentile(times, 50) * 1000, 2),
+                "p95": round(percentile(times, 95) * 1000, 2),
+                "max": round(max(times) * 1000, 2),
+            },
+        })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--entities", type=int, nargs="+", default=[100, 1000, 5000, 20000])
+    parser.add_argument("--climate", type=int, default=40)
+    parser.add_argument("--latency-ms", type=float, default=50.0)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--no-template", action="store_true",
+                        help="make the fake Supervisor reject /template requests")
+    parser.add_argument("--websocket", action="store_true",
+                        help="serve the WebSocket API, so the add-on runs on its state cache")
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--option", action="append", default=[], metavar="KEY=JSON",
+                        help="add-on option passed to the app, e.g. max_parallel_writes=16")
+    parser.add_argument("--output", help="write JSON results to this file instead of stdout")
+    args = parser.parse_args()
+
+    options = {"storage": "sqlite", "states_cache_ttl": 0}
+    for item in args.option:
+        key, _, value = item.partition("=")
+        options[key] = json.loads(value)
+
+    report = {
+        "timestamp": time.time(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "options": options,
+        "latency_ms": args.latency_ms,
+        "failure_rate": args.failure_rate,
+        "websocket": args.websocket,
+        "runs": [],
+    }
+
+    for entity_count in args.entities:
+        fake = fake_supervisor.FakeSupervisor(
+            entity_count, args.climate, args.latency_ms, args.failure_rate, not args.no_template,
+            websocket=args.websocket,
+        )
+        server = fake_supervisor.start(fake)
+        with tempfile.TemporaryDirectory() as data_dir:
+            proc, base_url = start_app(server.server_port, data_dir, options)
+            try:
+                results = run_suite(base_url, args.iterations, args.concurrency)
+            finally:
+                proc.terminate()
+                proc.wait(timeout=15)
+            # Counters of the uncached suite only
+            run = {
+                "entities": entity_count,
+                "climate_entities": args.climate,
+                "states_requests": fake.states_requests,
+                "template_requests": fake.template_requests,
+                "service_calls": fake.service_calls,
+                "websocket_connections": fake.websocket_connections,
+            }
+        with tempfile.TemporaryDirectory() as data_dir:
+            proc, base_url = start_app(
+                server.server_port, data_dir, dict(options, states_cache_ttl=CACHED_TTL)
+            )
+            try:
+                results.append(
+                    measure_thermostats("thermostats_cached", base_url, args.iterations, args.concurrency)
+                )
+            finally:
+                proc.terminate()
+                proc.wait(timeout=15)
+                server.shutdown()
+        run["results"] = results
+        report["runs"].append(run)
+        print(f"{entity_count} Entities: fertig", file=sys.stderr)
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""Run the add-on's WebSocket state cache against the fake Supervisor.
+
+Starts the fake with its WebSocket endpoint and the add-on pointed at it,
+then walks through the cache's life cycle: connect (auth, subscription,
+resync), state events, a stale event, a removal, and a dropped connection
+with a change missed meanwhile that the resync after reconnecting has to
+pick up. Exits non-zero on the first check that fails.
+
+    python3 benchmark/state_cache_check.py
+"""
+
+import argparse
+import sys
+import tempfile
+import time
+
+import requests
+
+import fake_supervisor
+from run_benchmark import start_app
+
+
+def wait_for(condition, timeout):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if condition():
+            return True
+        time.sleep(0.1)
+    return False
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--climate", type=int, default=10)
+    parser.add_argument("--timeout", type=float, default=10.0, help="seconds to wait for each check")
+    args = parser.parse_args()
+
+    fake = fake_supervisor.FakeSupervisor(200, args.climate, websocket=True)
+    server = fake_supervisor.start(fake)
+    failures = []
+
+    with tempfile.TemporaryDirectory() as data_dir:
+        proc, base_url = start_app(server.server_port, data_dir, {"storage": "sqlite"})
+        session = requests.Session()
+
+        def debug():
+            return session.get(f"{base_url}/api/debug").json()
+
+        def thermostats():
+            return {t["entity_id"]: t for t in session.get(f"{base_url}/api/thermostats").json()["thermostats"]}
+
+        def check(name, condition):
+            ok = wait_for(condition, args.timeout)
+            print(f"{'ok  ' if ok else 'FAIL'} {name}", file=sys.stderr)
+            if not ok:
+                failures.append(name)
+            return ok
+
+        try:
+            first, second, third = sorted(fake.climate)[:3]
+            check("connect, auth, subscribe and resync", lambda: (
+                debug()["state_cache_live"] and debug()["state_cache_entities"] == args.climate
+            ))
+            fetches = fake.states_requests + fake.template_requests
+
+            fake.update_climate(first, temperature=23.5)
+            check("state event updates the cache", lambda: thermostats()[first]["target_temperature"] == 23.5)
+            check("reads are served without a fetch", lambda: (
+                fake.states_requests + fake.template_requests == fetches
+            ))
+
+            stale = dict(fake.climate[first], last_updated="2000-01-01T00:00:00+00:00")
+            stale["attributes"] = dict(stale["attributes"], temperature=5.0)
+            fake.publish(first, fake.climate[first], stale)
+            time.sleep(0.5)
+            check("older event is ignored", lambda: thermostats()[first]["target_temperature"] == 23.5)
+
+            fake.remove_climate(second)
+            check("removal drops the entity", lambda: second not in thermostats())
+
+            fake.drop_websockets()
+            fake.update_climate(third, notify=False, temperature=26.0)
+            check("reconnect and resync pick up the missed change", lambda: (
+                fake.websocket_connections == 2
+                and debug()["state_cache_live"]
+                and thermostats()[third]["target_temperature"] == 26.0
+            ))
+        finally:
+            proc.terminate()
+            proc.wait(timeout=15)
+            server.shutdown()
+
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+"""Monotonic change sequence for incremental thermostat sync."""
+
+import threading
+from collections import OrderedDict
+
+
+class ChangeLog:
+    """Remember at which sequence number each key last changed.
+
+    Every ``record`` call that changes something advances ``seq`` by one.
+    Removed keys are kept as tombstones, at most ``max_removed`` of them;
+    evicting one raises ``horizon``, and ``since`` answers None for
+    sequence numbers before it, as removals after them may be lost.
+    """
+
+    def __init__(self, start, max_removed=1000):
+        self.seq = start
+        self.horizon = start
+        self.max_removed = max_removed
+        self._lock = threading.Lock()
+        self._changed = {}
+        self._removed = OrderedDict()
+
+    def record(self, changed=(), removed=()):
+        """Record changed and removed keys; return the new sequence number."""
+        if not changed and not removed:
+            return self.seq
+        with self._lock:
+            self.seq += 1
+            for key in changed:
+                self._changed[key] = self.seq
+                self._removed.pop(key, None)
+            for key in removed:
+                self._changed.pop(key, None)
+                self._removed[key] = self.seq
+                self._removed.move_to_end(key)
+            while len(self._removed) > self.max_removed:
+                _, seq = self._removed.popitem(last=False)
+                self.horizon = max(self.horizon, seq)
+            return self.seq
+
+    def since(self, seq):
+        """Return ``(changed, removed)`` keys after ``seq``.
+
+        Returns None if ``seq`` is outside the retained history (too old, or
+        from the future, e.g. handed out before a clock change) and the
+        caller needs a full resync.
+        """
+        with self._lock:
+            if seq < self.horizon or seq > self.seq:
+                return None
+            changed = {key for key, at in self._changed.items() if at > seq}
+            removed = [key for key, at in self._removed.items() if at > seq]
+            return changed, removed
@@ -0,0 +1,90 @@
+"""Confirmation of setpoint writes from observed Home Assistant state."""
+
+import threading
+
+
+class Confirmation:
+    """Setpoints of one batch that have not shown up in the state yet."""
+
+    def __init__(self, expected):
+        self.expected = dict(expected)
+        self.done = threading.Event()
+        if not self.expected:
+            self.done.set()
+
+
+class ConfirmationWatcher:
+    """Match incoming climate states against pending confirmations.
+
+    A single watcher serves every batch in flight: ``observe`` is fed each
+    state update (WebSocket event or REST fetch) and checks it only against
+    the confirmations waiting for that entity. ``matches(entity, temperature)``
+    decides whether an entity has reached a setpoint.
+    """
+
+    def __init__(self, matches):
+        self._matches = matches
+        self._lock = threading.Lock()
+        self._waiting = {}
+
+    def expect(self, targets):
+        """Start waiting for ``targets`` ({entity_id: temperature}).
+
+        Register before sending the writes, so state events that arrive
+        while the service call is still in flight are not missed.
+        """
+        confirmation = Confirmation(targets)
+        with self._lock:
+            for entity_id in confirmation.expected:
+                self._waiting.setdefault(entity_id, []).append(confirmation)
+        return confirmation
+
+    def discard(self, confirmation, entity_ids=None):
+        """Stop waiting for ``entity_ids`` (default: all still pending)."""
+        with self._lock:
+            if entity_ids is None:
+                entity_ids = list(confirmation.expected)
+            self._discard(confirmation, entity_ids)
+
+    def discard_except(self, confirmation, keep):
+        """Stop waiting for every pending entity_id not in ``keep``."""
+        with self._lock:
+            self._discard(confirmation, [eid for eid in confirmation.expected if eid not in keep])
+
+    def wait(self, confirmation, timeout):
+        """Wait up to ``timeout`` seconds; return the unconfirmed entity_ids."""
+        confirmation.done.wait(timeout)
+        with self._lock:
+            unconfirmed = list(confirmation.expected)
+        self.discard(confirmation)
+        return unconfirmed
+
+    def observe(self, entities):
+        if not self._waiting:
+            return
+        with self._lock:
+            for entity in entities:
+                entity_id = entity["entity_id"]
+                for confirmation in list(self._waiting.get(entity_id, ())):
+                    if self._matches(entity, confirmation.expected[entity_id]):
+                        del confirmation.expected[entity_id]
+                        self._unlink(entity_id, confirmation)
+                        if not confirmation.expected:
+                            confirmation.done.set()
+
+    def pending(self):
+        with self._lock:
+            return len(self._waiting)
+
+    def _discard(self, confirmation, entity_ids):
+        for entity_id in entity_ids:
+            if confirmation.expected.pop(entity_id, None) is not None:
+                self._unlink(entity_id, confirmation)
+        if not confirmation.expected:
+            confirmation.done.set()
+
+    def _unlink(self, entity_id, confirmation):
+        waiters = self._waiting[entity_id]
+        waiters.remove(confirmation)
+        if not waiters:
+            del self._waiting[entity_id]
@@ -0,0 +1,228 @@
+"""Pacing of setpoint writes against the Homematic IP radio duty cycle."""
+
+import heapq
+import itertools
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+logger = logging.getLogger(__name__)
+
+# The 1% duty cycle is accounted over a sliding hour
+WINDOW = 3600
+SENSOR_MAX_AGE = 60
+
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 1
+
+
+class _Write:
+    def __init__(self, entity_ids, temperature, cost, priority, seq, version):
+        self.entity_ids = entity_ids
+        self.temperature = temperature
+        self.cost = cost
+        self.priority = priority
+        self.seq = seq
+        self.version = version
+        self.superseded = set()
+        self.future = Future()
+        self.eta = None
+
+    @property
+    def target(self):
+        return self.entity_ids if len(self.entity_ids) > 1 else self.entity_ids[0]
+
+    def __lt__(self, other):
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+class DutyCycleScheduler:
+    """Queue setpoint writes and release them while the duty cycle allows.
+
+    Usage is tracked in percent of the access point's budget (0-100, as its
+    duty-cycle sensor reports it). Every thermostat written costs
+    ``cost_per_write``; costs age out of the sliding hour window. If
+    ``read_sensor`` returns a value, it replaces the estimate for everything
+    sent before the reading. Writes are released in priority order once
+    usage plus their cost stays within ``limit``, and run via ``executor``.
+
+    Each write carries a ``version`` (see ``next_version``). A write for a
+    thermostat replaces a queued write of an older version for it, and
+    writes of an older version than the last one accepted are dropped, so
+    a late retry cannot overwrite a newer setpoint. ``pending_setpoints``
+    lists what queued and in-flight writes are about to set.
+    """
+
+    def __init__(self, send, executor, limit, cost_per_write, read_sensor=None):
+        self._send = send
+        self._executor = executor
+        self.limit = limit
+        self.cost_per_write = cost_per_write
+        self._read_sensor = read_sensor
+        self._sent = deque()
+        self._queue = []
+        self._seq = itertools.count()
+        self._versions = itertools.count()
+        # entity_id -> newest accepted version, its queued write, and the
+        # (version, temperature) of its queued or in-flight write
+        self._latest = {}
+        self._queued = {}
+        self._pending = {}
+        self._cond = threading.Condition()
+        self._sensor_value = None
+        self._sensor_at = 0.0
+        self._thread = threading.Thread(target=self._run, name="duty-cycle", daemon=True)
+        self._thread.start()
+
+    def max_group_size(self):
+        """Largest number of thermostats one service call may address."""
+        return max(1, int(self.limit / self.cost_per_write))
+
+    def next_version(self):
+        """Version for the writes of one request, shared by its retries."""
+        return next(self._versions)
+
+    def submit(self, entity_ids, temperature, priority=PRIORITY_NORMAL, version=None):
+        """Queue one service call addressing ``entity_ids``.
+
+        Returns a Future resolving once the call was sent, to the set of
+        entity_ids it ended up not writing because a newer write replaced
+        it; its ``eta`` attribute holds the estimated start time (epoch
+        seconds).
+        """
+        if version is None:
+            version = self.next_version()
+        replaced = []
+        with self._cond:
+            keep = [eid for eid in entity_ids if self._latest.get(eid, version) <= version]
+            for entity_id in keep:
+                self._latest[entity_id] = version
+                older = self._queued.get(entity_id)
+                if older is not None and older.version < version:
+                    if self._drop(older, entity_id):
+                        replaced.append(older)
+            write = _Write(
+                keep, temperature, len(keep) * self.cost_per_write, priority, next(self._seq), version
+            )
+            write.superseded.update(eid for eid in entity_ids if eid not in keep)
+            if keep:
+                for entity_id in keep:
+                    self._queued[entity_id] = write
+                    self._pending[entity_id] = (version, temperature)
+                heapq.heappush(self._queue, write)
+            if replaced:
+                heapq.heapify(self._queue)
+            self._estimate()
+            self._cond.notify()
+        write.future.eta = write.eta if keep else time.time()
+        if not keep:
+            replaced.append(write)
+        for dropped in replaced:
+            dropped.future.set_result(frozenset(dropped.superseded))
+        return write.future
+
+    def pending_setpoints(self):
+        """Setpoints of queued and in-flight writes, by entity_id."""
+        with self._cond:
+            return {entity_id: temperature for entity_id, (_, temperature) in self._pending.items()}
+
+    def _drop(self, write, entity_id):
+        """Take ``entity_id`` out of a queued write; True if nothing is left of it."""
+        write.entity_ids = [eid for eid in write.entity_ids if eid != entity_id]
+        write.superseded.add(entity_id)
+        write.cost -= self.cost_per_write
+        if write.entity_ids:
+            return False
+        self._queue.remove(write)
+        return True
+
+    def usage(self):
+        """Estimated current usage in percent of the duty-cycle budget."""
+        with self._cond:
+            return self._usage_at(time.time(), self._sent)
+
+    def pending(self):
+        return len(self._queue)
+
+    def _usage_at(self, now, sent):
+        usage = 0.0
+        base_after = now - WINDOW
+        if self._sensor_value is not None and now - self._sensor_at < WINDOW:
+            usage = self._sensor_value
+            base_after = max(base_after, self._sensor_at)
+        return usage + sum(cost for at, cost in sent if at > base_after)
+
+    def _wait_for(self, cost, now, sent):
+        """Seconds until ``cost`` fits into the budget, given ``sent``."""
+        if self._usage_at(now, sent) + cost <= self.limit:
+            return 0.0
+        # Usage only drops as earlier writes age out of the window
+        for at, _ in sent:
+            later = at + WINDOW - now
+            if later > 0 and self._usage_at(now + later, sent) + cost <= self.limit:
+                return later
+        # Nothing of ours left to age out: wait for the sensor reading to expire
+        return max(0.0, self._sensor_at + WINDOW - now)
+
+    def _estimate(self):
+        """Assign an estimated start time to every queued write."""
+        now = time.time()
+        sent = deque(self._sent)
+        t = now
+        for write in sorted(self._queue):
+            t += self._wait_for(write.cost, t, sent)
+            write.eta = t
+            sent.append((t, write.cost))
+
+    def _refresh_sensor(self):
+        if self._read_sensor is None or time.time() - self._sensor_at < SENSOR_MAX_AGE:
+            return
+        try:
+            value = self._read_sensor()
+        except Exception as e:
+            logger.warning(f"Duty-Cycle-Sensor nicht lesbar: {e}")
+            value = None
+        with self._cond:
+            self._sensor_at = time.time()
+            self._sensor_value = value
+
+    def _run(self):
+        while True:
+            self._refresh_sensor()
+            with self._cond:
+                while not self._queue:
+                    self._cond.wait()
+                now = time.time()
+                while self._sent and self._sent[0][0] < now - WINDOW:
+                    self._sent.popleft()
+                write = self._queue[0]
+                wait = self._wait_for(write.cost, now, self._sent)
+                if wait > 0:
+                    # Re-evaluate early: higher-priority writes or a fresh
+                    # sensor reading may change the picture
+                    self._cond.wait(min(wait, SENSOR_MAX_AGE))
+                    continue
+                heapq.heappop(self._queue)
+                for entity_id in write.entity_ids:
+                    if self._queued.get(entity_id) is write:
+                        del self._queued[entity_id]
+                self._sent.append((now, write.cost))
+            self._executor.submit(self._execute, write)
+
+    def _execute(self, write):
+        try:
+            self._send(write.target, write.temperature)
+        except Exception as e:
+            self._settle(write)
+            write.future.set_exception(e)
+        else:
+            self._settle(write)
+            write.future.set_result(frozenset(write.superseded))
+
+    def _settle(self, write):
+        with self._cond:
+            for entity_id in write.entity_ids:
+                if self._pending.get(entity_id, (None,))[0] == write.version:
+                    del self._pending[entity_id]
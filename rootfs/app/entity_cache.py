@@ -0,0 +1,90 @@
+"""Short-lived shared cache with single-flight loading."""
+
+import threading
+import time
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+
+
+class CoalescingCache:
+    """Cache the result of ``loader`` for ``ttl`` seconds.
+
+    Concurrent callers that miss the cache wait for the one load already in
+    flight instead of starting their own. A failed load (``loader`` returning
+    None) is handed to the waiting callers but not cached.
+    """
+
+    def __init__(self, loader, ttl):
+        self._loader = loader
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._value = None
+        self._loaded_at = 0.0
+        self._flight = None
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    def get(self, max_age=None):
+        """Return the cached value, loading it if older than the TTL.
+
+        ``max_age`` tightens the TTL for this call, for callers that need a
+        recent value without giving up coalescing.
+        """
+        ttl = self.ttl if max_age is None else min(self.ttl, max_age)
+        with self._lock:
+            if self._value is not None and time.monotonic() - self._loaded_at < ttl:
+                self.hits += 1
+                return self._value
+            flight = self._flight
+            if flight is not None:
+                self.coalesced += 1
+                leader = False
+            else:
+                self.misses += 1
+                flight = self._flight = _Flight()
+                leader = True
+
+        if not leader:
+            flight.done.wait()
+            return flight.result
+
+        try:
+            flight.result = self._loader()
+        finally:
+            with self._lock:
+                if flight.result is not None:
+                    self._value = flight.result
+                    self._loaded_at = time.monotonic()
+                self._flight = None
+            flight.done.set()
+        return flight.result
+
+    def peek(self):
+        """Return the cached value regardless of its age, without loading."""
+        return self._value
+
+    def fresh(self):
+        """Return the cached value if it is within the TTL, without loading."""
+        with self._lock:
+            if self._value is not None and time.monotonic() - self._loaded_at < self.ttl:
+                self.hits += 1
+                return self._value
+            return None
+
+    def invalidate(self):
+        with self._lock:
+            self._value = None
+
+    def update(self, fn):
+        """Replace the cached value with ``fn(value)`` if one is cached."""
+        with self._lock:
+            if self._value is not None:
+                self._value = fn(self._value)
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "coalesced": self.coalesced}
@@ -0,0 +1,51 @@
+"""Lookup index over a snapshot of climate entities."""
+
+from bisect import bisect_left
+from collections import defaultdict
+
+
+class EntityIndex:
+    """Answer prefix, area and hvac_mode filters without scanning every entity.
+
+    Results keep the order of the snapshot the index was built from, so a
+    filtered or paginated list reads like a slice of the full one.
+    """
+
+    def __init__(self, entities, areas=None):
+        self.entities = {e["entity_id"]: e for e in entities}
+        self.order = list(self.entities)
+        self.position = {entity_id: i for i, entity_id in enumerate(self.order)}
+        self.sorted_ids = sorted(self.order)
+        self.by_mode = defaultdict(set)
+        for entity in entities:
+            self.by_mode[entity["hvac_mode"]].add(entity["entity_id"])
+        self.areas = areas or {}
+        self.by_area = defaultdict(set)
+        for entity_id, area in self.areas.items():
+            if area and entity_id in self.entities:
+                self.by_area[area.casefold()].add(entity_id)
+
+    def with_prefix(self, prefix):
+        ids = set()
+        i = bisect_left(self.sorted_ids, prefix)
+        while i < len(self.sorted_ids) and self.sorted_ids[i].startswith(prefix):
+            ids.add(self.sorted_ids[i])
+            i += 1
+        return ids
+
+    def select(self, prefixes=None, areas=None, modes=None):
+        """Return the entity_ids matching all given filters, in snapshot order.
+
+        Each filter is a list of alternatives; None means no filtering.
+        """
+        selected = None
+        for candidates in (
+            None if prefixes is None else set().union(*(self.with_prefix(p) for p in prefixes)),
+            None if areas is None else set().union(*(self.by_area.get(a.casefold(), ()) for a in areas)),
+            None if modes is None else set().union(*(self.by_mode.get(m, ()) for m in modes)),
+        ):
+            if candidates is not None:
+                selected = candidates if selected is None else selected & candidates
+        if selected is None:
+            return list(self.order)
+        return sorted(selected, key=self.position.__getitem__)
@@ -0,0 +1,57 @@
+"""Fan-out of change events to Server-Sent Events subscribers."""
+
+import queue
+import threading
+
+import json_backend
+
+SUBSCRIBER_QUEUE_SIZE = 500
+
+
+class EventHub:
+    """Distribute published events to every connected stream subscriber.
+
+    Each subscriber owns a bounded queue. A subscriber that falls too far
+    behind has its backlog replaced by a single ``resync`` event, telling the
+    client to reload the full state instead of applying stale deltas.
+    """
+
+    def __init__(self):
+        self._subscribers = set()
+        self._lock = threading.Lock()
+
+    def subscribe(self):
+        q = queue.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        with self._lock:
+            self._subscribers.add(q)
+        return q
+
+    def unsubscribe(self, q):
+        with self._lock:
+            self._subscribers.discard(q)
+
+    def subscriber_count(self):
+        return len(self._subscribers)
+
+    def publish(self, event, data):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for q in subscribers:
+            try:
+                q.put_nowait((event, data))
+            except queue.Full:
+                _drain(q)
+                q.put_nowait(("resync", {}))
+
+
+def _drain(q):
+    try:
+        while True:
+            q.get_nowait()
+    except queue.Empty:
+        pass
+
+
+def format_sse(event, data):
+    """Encode one event in the text/event-stream wire format."""
+    return f"event: {event}\ndata: {json_backend.dumps(data)}\n\n"
@@ -0,0 +1,102 @@
+"""Bookkeeping for bulk operations that run in the background."""
+
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+
+def _iso(ts):
+    return datetime.fromtimestamp(ts, timezone.utc).isoformat() if ts else None
+
+
+class Job:
+    """Progress of one bulk write: per-entity status and the final response."""
+
+    def __init__(self, kind, targets, skipped):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.created = time.time()
+        self.finished = None
+        self.status = "running"
+        self.skipped = list(skipped)
+        self.entities = {
+            entity_id: {"status": "pending", "temperature": temperature}
+            for entity_id, temperature in targets
+        }
+        self.result = None
+        self.error = None
+
+
+class JobTable:
+    """Running and recently finished jobs, held in memory.
+
+    Running jobs are always kept; of the finished ones only the newest
+    ``max_finished`` remain, older ones are evicted as new jobs finish.
+    """
+
+    def __init__(self, max_finished):
+        self.max_finished = max_finished
+        self._lock = threading.Lock()
+        self._jobs = OrderedDict()
+        self._finished = OrderedDict()
+
+    def create(self, kind, targets, skipped):
+        job = Job(kind, targets, skipped)
+        with self._lock:
+            self._jobs[job.id] = job
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id) or self._finished.get(job_id)
+
+    def entity_done(self, job, entity_id, error):
+        with self._lock:
+            entry = job.entities[entity_id]
+            entry["status"] = "ok" if error is None else "error"
+            if error is not None:
+                entry["error"] = error
+
+    def finish(self, job, result=None, queued=(), unconfirmed=(), superseded=(), error=None):
+        """Mark ``job`` done with response ``result``, or failed with ``error``."""
+        with self._lock:
+            for entity_id in queued:
+                job.entities[entity_id]["status"] = "queued"
+            for entity_id in unconfirmed:
+                job.entities[entity_id]["status"] = "unconfirmed"
+            for entity_id in superseded:
+                job.entities[entity_id]["status"] = "superseded"
+            job.result = result
+            job.error = error
+            job.status = "failed" if error is not None else "done"
+            job.finished = time.time()
+            self._jobs.pop(job.id, None)
+            self._finished[job.id] = job
+            while len(self._finished) > self.max_finished:
+                self._finished.popitem(last=False)
+
+    def snapshot(self, job):
+        """JSON-ready view of ``job``'s progress."""
+        with self._lock:
+            entities = {entity_id: dict(entry) for entity_id, entry in job.entities.items()}
+            completed = sum(1 for entry in entities.values() if entry["status"] != "pending")
+            return {
+                "job_id": job.id,
+                "kind": job.kind,
+                "status": job.status,
+                "created": _iso(job.created),
+                "finished": _iso(job.finished),
+                "total": len(entities),
+                "completed": completed,
+                "entities": entities,
+                "errors": [entry["error"] for entry in entities.values() if "error" in entry],
+                "skipped": job.skipped,
+                "result": job.result,
+                "error": job.error,
+            }
+
+    def stats(self):
+        with self._lock:
+            return {"running": len(self._jobs), "finished": len(self._finished)}
@@ -0,0 +1,49 @@
+"""JSON encoding and decoding via orjson when installed, stdlib json otherwise.
+
+orjson is optional: not every architecture the add-on is built for has a
+wheel. Both backends produce the same JSON for the data this app handles
+(str keys, numbers, strings, lists, None); orjson is several times faster,
+which matters for large thermostat lists on low-power hosts.
+"""
+
+import json
+
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+BACKEND = "orjson" if orjson is not None else "json"
+
+
+def loads(data):
+    """Decode ``data`` (str or bytes)."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def dumps(obj, indent=False):
+    """Encode ``obj`` compactly, or with two-space indentation."""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 if indent else 0).decode()
+    if indent:
+        return json.dumps(obj, indent=2)
+    return json.dumps(obj, separators=(",", ":"))
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """Flask JSON provider backed by orjson, with Flask's key sorting."""
+
+    def dumps(self, obj, **kwargs):
+        if orjson is None:
+            return super().dumps(obj, **kwargs)
+        option = orjson.OPT_SORT_KEYS if self.sort_keys else 0
+        return orjson.dumps(obj, default=self.default, option=option).decode()
+
+    def loads(self, s, **kwargs):
+        if orjson is None:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
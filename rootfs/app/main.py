@@ -4,15 +4,46 @@
 import json
 import os
 import logging
-from flask import Flask, render_template, request, jsonify
+import queue
+import signal
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from datetime import datetime, timezone
+from flask import Flask, Response, render_template, request, jsonify
 import requests
+from requests.adapters import HTTPAdapter
+from waitress import create_server
+
+from change_log import ChangeLog
+from confirm import ConfirmationWatcher
+from duty_cycle import PRIORITY_HIGH, PRIORITY_NORMAL, DutyCycleScheduler
+from entity_cache import CoalescingCache
+from entity_index import EntityIndex
+from event_stream import EventHub, format_sse
+from jobs import JobTable
+import json_backend
+from json_backend import FastJSONProvider
+from metrics import Registry
+from originals_store import OriginalsStore
+from retry import RetryPolicy, is_transient
+import setpoint_columns
+from setpoint_columns import SetpointColumns, plan_from_columns
+from state_db import StateDatabase
+from state_cache import ClimateStateCache
+from states_parser import iter_climate_states
+from write_plan import final_setpoint, plan_writes, setpoint_matches, split_noop_targets
 
 app = Flask(__name__)
+app.json = FastJSONProvider(app)
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Home Assistant Supervisor API
-SUPERVISOR_URL = "http://supervisor/core/api"
+# Home Assistant Supervisor API (overridable for local benchmarks)
+SUPERVISOR_URL = os.environ.get("SUPERVISOR_URL", "http://supervisor/core/api")
+SUPERVISOR_WS_URL = os.environ.get("SUPERVISOR_WS_URL", "ws://supervisor/core/websocket")
 
 
 def find_supervisor_token():
@@ -44,87 +75,1098 @@ def find_supervisor_token():
 
 SUPERVISOR_TOKEN = find_supervisor_token()
 
-# Persistence file for original temperatures
-ORIGINALS_PATH = "/data/original_temps.json"
-
-
-def ha_headers():
-    """Get headers for Home Assistant API requests."""
-    return {
+DATA_DIR = os.environ.get("DATA_DIR", "/data")
+
+# Persistence for original temperatures and action history
+ORIGINALS_PATH = os.path.join(DATA_DIR, "original_temps.json")
+DATABASE_PATH = os.path.join(DATA_DIR, "thermostat_manager.db")
+
+# Add-on options written by the Supervisor from config.yaml
+OPTIONS_PATH = os.path.join(DATA_DIR, "options.json")
+DEFAULT_OPTIONS = {
+    "max_parallel_writes": 8,
+    "http_pool_size": 10,
+    "http_connect_timeout": 5,
+    "http_timeout": 10,
+    "stream_poll_interval": 15,
+    "server": "production",
+    "server_threads": 16,
+    "server_connection_limit": 100,
+    "server_keepalive_timeout": 120,
+    "storage": "sqlite",
+    "history_days": 90,
+    "states_fetch": "template",
+    "states_cache_ttl": 2,
+    "duty_cycle_scheduler": False,
+    "duty_cycle_limit": 80,
+    "duty_cycle_cost_per_write": 0.5,
+    "duty_cycle_sensor": "",
+    "duty_cycle_max_wait": 10,
+    "job_history": 100,
+    "retry_attempts": 3,
+    "retry_base_delay": 0.5,
+    "retry_max_delay": 8,
+    "retry_deadline": 30,
+    "confirm_writes": False,
+    "confirm_timeout": 30,
+}
+
+
+def load_options():
+    """Load add-on options, falling back to defaults for missing keys."""
+    options = dict(DEFAULT_OPTIONS)
+    if os.path.exists(OPTIONS_PATH):
+        try:
+            with open(OPTIONS_PATH, "r") as f:
+                options.update(json.load(f))
+        except Exception as e:
+            logger.error(f"Fehler beim Laden der Optionen: {e}")
+    return options
+
+
+OPTIONS = load_options()
+
+# Bounded pool for concurrent climate service calls
+WRITE_EXECUTOR = ThreadPoolExecutor(
+    max_workers=max(1, int(OPTIONS["max_parallel_writes"])),
+    thread_name_prefix="set-temperature",
+)
+# Background bulk operations; kept apart from WRITE_EXECUTOR, whose workers
+# the jobs wait on
+JOB_EXECUTOR = ThreadPoolExecutor(max_workers=4, thread_name_prefix="job")
+JOBS = JobTable(max_finished=max(1, int(OPTIONS["job_history"])))
+
+
+def create_ha_session():
+    """Create the shared keep-alive session for Supervisor API requests."""
+    session = requests.Session()
+    session.headers.update({
         "Authorization": f"Bearer {SUPERVISOR_TOKEN}",
         "Content-Type": "application/json",
+    })
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=int(OPTIONS["http_pool_size"]))
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+# Live updates for /api/stream subscribers
+EVENT_HUB = EventHub()
+STREAM_KEEPALIVE = 15
+# Each open stream holds a waitress worker thread for its whole lifetime, so
+# only half of them may stream; further clients get a 503 and fall back to
+# polling instead of starving the API
+MAX_STREAMS = int(OPTIONS["server_threads"]) // 2
+STREAM_SLOTS = threading.BoundedSemaphore(MAX_STREAMS) if MAX_STREAMS else None
+
+# Prometheus metrics served on /metrics
+METRICS = Registry()
+HA_LATENCY = METRICS.histogram(
+    "thermostat_manager_ha_request_seconds",
+    "Latency of Home Assistant API calls, failed ones (timeouts, 5xx) included",
+    ["operation", "outcome"],
+)
+HTTP_REQUESTS = METRICS.counter(
+    "thermostat_manager_http_requests_total",
+    "Handled HTTP requests per endpoint",
+    ["endpoint", "method", "status"],
+)
+ENTITY_WRITES = METRICS.counter(
+    "thermostat_manager_set_temperature_total",
+    "Setpoint writes per entity and result",
+    ["entity_id", "result"],
+)
+HA_ERRORS = METRICS.counter(
+    "thermostat_manager_errors_total",
+    "Failed Home Assistant API calls per operation and error class",
+    ["operation", "error"],
+)
+HA_RETRIES = METRICS.counter(
+    "thermostat_manager_retries_total",
+    "Retried Home Assistant API calls per operation",
+    ["operation"],
+)
+
+
+def error_class(e):
+    """Classify an exception for the error counter."""
+    response = getattr(e, "response", None)
+    if response is not None:
+        return f"http_{response.status_code}"
+    return type(e).__name__
+
+
+HA_SESSION = create_ha_session()
+STATES_CHUNK_SIZE = 64 * 1024
+HA_TIMEOUT = (float(OPTIONS["http_connect_timeout"]), float(OPTIONS["http_timeout"]))
+# Transient Supervisor errors (502 while Core restarts, timeouts) are retried
+RETRY = RetryPolicy(
+    retries=int(OPTIONS["retry_attempts"]),
+    base_delay=float(OPTIONS["retry_base_delay"]),
+    max_delay=float(OPTIONS["retry_max_delay"]),
+    deadline=float(OPTIONS["retry_deadline"]),
+)
+
+
+def ha_pool_stats():
+    """Return connection pool usage of the shared Supervisor session."""
+    opened = 0
+    requests_sent = 0
+    for adapter in set(HA_SESSION.adapters.values()):
+        pools = adapter.poolmanager.pools
+        for key in pools.keys():
+            pool = pools[key]
+            opened += pool.num_connections
+            requests_sent += pool.num_requests
+    return {
+        "connections_opened": opened,
+        "connections_reused": max(0, requests_sent - opened),
+        "requests": requests_sent,
     }
 
 
 def load_originals():
-    """Load saved original temperatures from disk."""
-    if os.path.exists(ORIGINALS_PATH):
-        with open(ORIGINALS_PATH, "r") as f:
-            return json.load(f)
-    return None
+    """Load saved original temperatures (cached, re-read only if the file changed)."""
+    return ORIGINALS.load()
+
+
+def status_payload(originals):
+    """Build the offset status reported by /api/status and the stream."""
+    return {
+        "offset_active": originals is not None,
+        "saved_count": len(originals) if originals else 0,
+    }
 
 
-def save_originals(originals):
-    """Save original temperatures to disk."""
-    os.makedirs(os.path.dirname(ORIGINALS_PATH), exist_ok=True)
-    with open(ORIGINALS_PATH, "w") as f:
-        json.dump(originals, f, indent=2)
+def publish_status(originals):
+    """Push the offset status and saved originals to stream subscribers."""
+    payload = status_payload(originals)
+    payload["originals"] = originals or {}
+    EVENT_HUB.publish("status", payload)
+
+
+_last_originals = {}
+
+
+def on_originals_change(originals):
+    """Publish the new status and sequence thermostats whose original changed."""
+    global _last_originals
+    current = originals or {}
+    CHANGES.record(changed=[
+        entity_id for entity_id in current.keys() | _last_originals.keys()
+        if current.get(entity_id) != _last_originals.get(entity_id)
+    ])
+    _last_originals = current
+    publish_status(originals)
+
+
+def create_originals_store():
+    """Create the originals store selected by the ``storage`` option."""
+    if OPTIONS["storage"] == "json":
+        return OriginalsStore(ORIGINALS_PATH, on_change=on_originals_change)
+    return StateDatabase(
+        DATABASE_PATH,
+        on_change=on_originals_change,
+        legacy_json_path=ORIGINALS_PATH,
+        retention_days=int(OPTIONS["history_days"]),
+    )
+
+
+ORIGINALS = create_originals_store()
+_last_originals = ORIGINALS.load() or {}
+
+METRICS.gauge(
+    "thermostat_manager_cached_entities",
+    "Climate entities held by the WebSocket state cache",
+    lambda: len(STATE_CACHE),
+)
+METRICS.gauge(
+    "thermostat_manager_saved_originals",
+    "Thermostats with a saved original temperature",
+    lambda: len(ORIGINALS.load() or {}),
+)
+for _name in ("hits", "misses", "coalesced"):
+    METRICS.gauge(
+        f"thermostat_manager_states_cache_{_name}_total",
+        f"States cache lookups: {_name}",
+        lambda name=_name: ENTITY_CACHE.stats()[name],
+        kind="counter",
+    )
+METRICS.gauge(
+    "thermostat_manager_http_pool_connections_opened",
+    "Connections opened by the Supervisor API session",
+    lambda: ha_pool_stats()["connections_opened"],
+)
+METRICS.gauge(
+    "thermostat_manager_http_pool_connections_reused",
+    "Requests served over an already open Supervisor API connection",
+    lambda: ha_pool_stats()["connections_reused"],
+)
+
+
+def climate_entity_from_state(state):
+    """Convert a Home Assistant state object into our climate entity dict."""
+    attrs = state.get("attributes", {})
+    return {
+        "entity_id": state["entity_id"],
+        "name": attrs.get("friendly_name", state["entity_id"]),
+        "current_temperature": attrs.get("current_temperature"),
+        "target_temperature": attrs.get("temperature"),
+        "min_temp": attrs.get("min_temp", 5),
+        "max_temp": attrs.get("max_temp", 30),
+        "hvac_mode": state.get("state", "unknown"),
+        "target_temp_step": attrs.get("target_temp_step"),
+        "last_updated": state.get("last_updated"),
+    }
 
 
-def delete_originals():
-    """Delete the saved original temperatures file."""
-    if os.path.exists(ORIGINALS_PATH):
-        os.remove(ORIGINALS_PATH)
+# Jinja expressions rendering climate_entity_from_state() fields on the HA side
+CLIMATE_TEMPLATE_FIELDS = {
+    "entity_id": "s.entity_id",
+    "name": "s.attributes.get('friendly_name', s.entity_id)",
+    "current_temperature": "s.attributes.get('current_temperature')",
+    "target_temperature": "s.attributes.get('temperature')",
+    "min_temp": "s.attributes.get('min_temp', 5)",
+    "max_temp": "s.attributes.get('max_temp', 30)",
+    "hvac_mode": "s.state",
+    "target_temp_step": "s.attributes.get('target_temp_step')",
+    "last_updated": "s.last_updated.isoformat()",
+}
+CLIMATE_TEMPLATE = (
+    "[{%- for s in states.climate -%}{{ {"
+    + ", ".join(f'"{key}": {expr}' for key, expr in CLIMATE_TEMPLATE_FIELDS.items())
+    + "} | tojson }}{% if not loop.last %},{% endif %}{%- endfor -%}]"
+)
+# entity_id -> area name (null without area) for every climate entity
+AREA_TEMPLATE = (
+    "{ {%- for s in states.climate -%}{{ s.entity_id | tojson }}: {{ area_name(s.entity_id) | tojson }}"
+    "{% if not loop.last %},{% endif %}{%- endfor -%} }"
+)
+AREA_CACHE_TTL = 300
+TEMPLATE_RETRY_INTERVAL = 600
+
+_template_retry_at = 0
+
+
+def fetch_via_states():
+    """Fetch climate entities by streaming the full /states list.
+
+    The response body is scanned as it streams in and only climate states
+    are decoded, so other domains never get materialized.
+    """
+    with HA_SESSION.get(f"{SUPERVISOR_URL}/states", timeout=HA_TIMEOUT, stream=True) as resp:
+        resp.raise_for_status()
+        return [
+            climate_entity_from_state(state)
+            for state in iter_climate_states(resp.iter_content(STATES_CHUNK_SIZE))
+        ]
 
 
-def get_climate_entities():
-    """Fetch all climate entities from Home Assistant."""
+def fetch_via_template():
+    """Fetch climate entities rendered by Home Assistant's template API.
+
+    Returns None and disables the template path for a while if the endpoint
+    is unavailable (a 4xx answer) or returns something unexpected. Transient
+    errors (5xx, 429) are raised for ``RETRY`` to handle instead.
+    """
+    global _template_retry_at
     try:
-        resp = requests.get(
-            f"{SUPERVISOR_URL}/states",
-            headers=ha_headers(),
-            timeout=10,
+        resp = HA_SESSION.post(
+            f"{SUPERVISOR_URL}/template",
+            json={"template": CLIMATE_TEMPLATE},
+            timeout=HA_TIMEOUT,
         )
         resp.raise_for_status()
-        states = resp.json()
-
-        climate_entities = []
-        for entity in states:
-            if entity["entity_id"].startswith("climate."):
-                attrs = entity.get("attributes", {})
-                climate_entities.append({
-                    "entity_id": entity["entity_id"],
-                    "name": attrs.get("friendly_name", entity["entity_id"]),
-                    "current_temperature": attrs.get("current_temperature"),
-                    "target_temperature": attrs.get("temperature"),
-                    "min_temp": attrs.get("min_temp", 5),
-                    "max_temp": attrs.get("max_temp", 30),
-                    "hvac_mode": entity.get("state", "unknown"),
-                })
-        return climate_entities
+        entities = json_backend.loads(resp.content)
+        if not isinstance(entities, list):
+            raise ValueError("Unerwartete Antwort")
+        return entities
+    except (requests.HTTPError, ValueError) as e:
+        if is_transient(e):
+            raise
+        _template_retry_at = time.monotonic() + TEMPLATE_RETRY_INTERVAL
+        logger.warning(f"Template-API nicht verfügbar ({e}), verwende /states")
+        return None
+
+
+def fetch_climate_entities():
+    """Fetch all climate entities from the Home Assistant REST API.
+
+    Uses the template API when the ``states_fetch`` option selects it and
+    falls back to the full /states list otherwise.
+
+    Returns None if the request fails.
+    """
+    def fetch_once():
+        entities = None
+        if OPTIONS["states_fetch"] == "template" and time.monotonic() >= _template_retry_at:
+            entities = fetch_via_template()
+        if entities is None:
+            entities = fetch_via_states()
+        return entities
+
+    def log_retry(retry, delay, error):
+        HA_RETRIES.inc("get_climate_entities")
+        logger.warning(
+            f"Abruf der Climate-Entities fehlgeschlagen ({error}), "
+            f"Wiederholung {retry}/{RETRY.retries} in {delay:.1f} s"
+        )
+
+    started = time.perf_counter()
+    try:
+        entities = RETRY.call(fetch_once, on_retry=log_retry)
     except Exception as e:
+        HA_LATENCY.observe(time.perf_counter() - started, "get_climate_entities", "error")
+        HA_ERRORS.inc("get_climate_entities", error_class(e))
         logger.error(f"Fehler beim Abrufen der Climate-Entities: {e}")
-        return []
+        return None
+    HA_LATENCY.observe(time.perf_counter() - started, "get_climate_entities", "success")
+    publish_entity_changes(entities, complete=True)
+    return entities
+
+
+STATE_CACHE = ClimateStateCache(
+    SUPERVISOR_WS_URL,
+    SUPERVISOR_TOKEN,
+    convert=climate_entity_from_state,
+    resync=fetch_climate_entities,
+    listener=lambda entities, removed: publish_entity_changes(entities, removed),
+)
+
+
+# Shared REST result while the WebSocket cache is not live
+ENTITY_CACHE = CoalescingCache(fetch_climate_entities, float(OPTIONS["states_cache_ttl"]))
+
+
+# Up to this many entities not in any cache are fetched one by one
+# (/states/<entity_id>) rather than through the full climate list
+SINGLE_FETCH_LIMIT = 5
+
+
+def fetch_climate_entity(entity_id):
+    """Fetch one climate entity via /states/<entity_id>.
+
+    Returns None if the entity does not exist; raises on other errors.
+    """
+    def fetch_once():
+        resp = HA_SESSION.get(f"{SUPERVISOR_URL}/states/{entity_id}", timeout=HA_TIMEOUT)
+        if resp.status_code == 404:
+            return None
+        resp.raise_for_status()
+        return climate_entity_from_state(json_backend.loads(resp.content))
+
+    def log_retry(retry, delay, error):
+        HA_RETRIES.inc("get_climate_entity")
+        logger.warning(
+            f"Abruf von {entity_id} fehlgeschlagen ({error}), "
+            f"Wiederholung {retry}/{RETRY.retries} in {delay:.1f} s"
+        )
+
+    started = time.perf_counter()
+    try:
+        entity = RETRY.call(fetch_once, on_retry=log_retry)
+    except Exception:
+        HA_LATENCY.observe(time.perf_counter() - started, "get_climate_entity", "error")
+        raise
+    HA_LATENCY.observe(time.perf_counter() - started, "get_climate_entity", "success")
+    if entity is not None:
+        publish_entity_changes([entity])
+    return entity
+
+
+def lookup_entities(entity_ids):
+    """Get the given climate entities without fetching all of them if possible.
+
+    Served by entity_id from the live cache or a still fresh states cache.
+    On a miss, a few entities are fetched individually, which is one small
+    round trip each instead of the whole list. Unknown ids are left out.
+
+    Returns ``(entities, errors)``; ``errors`` holds a message for every id
+    that could not be fetched. Anything in ``entity_ids`` that is not a
+    climate entity_id string is ignored.
+    """
+    if not isinstance(entity_ids, (list, tuple)):
+        entity_ids = ()
+    entity_ids = list(dict.fromkeys(
+        eid for eid in entity_ids if isinstance(eid, str) and eid.startswith("climate.")
+    ))
+    if STATE_CACHE.is_live():
+        return [entity for entity in map(STATE_CACHE.get, entity_ids) if entity is not None], []
+
+    seq = CHANGES.seq
+    cached = ENTITY_CACHE.fresh()
+    if cached is None and len(entity_ids) > SINGLE_FETCH_LIMIT:
+        cached = ENTITY_CACHE.get()
+        if cached is None:
+            return [], [f"Fehler beim Abrufen von {entity_id}" for entity_id in entity_ids]
+    if cached is not None:
+        by_id = entity_index(seq, cached, None).entities
+        return [by_id[eid] for eid in entity_ids if eid in by_id], []
+
+    entities = []
+    errors = []
+    for entity_id in entity_ids:
+        try:
+            entity = fetch_climate_entity(entity_id)
+        except Exception as e:
+            HA_ERRORS.inc("get_climate_entity", error_class(e))
+            message = f"Fehler beim Abrufen von {entity_id}: {e}"
+            logger.error(message)
+            errors.append(message)
+            continue
+        if entity is not None:
+            entities.append(entity)
+    return entities, errors
+
+
+def fetch_areas():
+    """Fetch the area of every climate entity via the template API.
+
+    Areas are neither in the states nor in state_changed events, so they are
+    fetched separately and only when a request filters or asks for them.
+    Returns None if the template API fails.
+    """
+    try:
+        resp = HA_SESSION.post(
+            f"{SUPERVISOR_URL}/template",
+            json={"template": AREA_TEMPLATE},
+            timeout=HA_TIMEOUT,
+        )
+        resp.raise_for_status()
+        areas = json_backend.loads(resp.content)
+        if not isinstance(areas, dict):
+            raise ValueError("Unerwartete Antwort")
+    except (requests.RequestException, ValueError) as e:
+        HA_ERRORS.inc("get_areas", error_class(e))
+        logger.warning(f"Bereiche konnten nicht abgerufen werden: {e}")
+        return None
+    previous = AREAS.peek() or {}
+    CHANGES.record(changed=[
+        entity_id for entity_id in areas.keys() | previous.keys()
+        if areas.get(entity_id) != previous.get(entity_id)
+    ])
+    return areas
+
+
+AREAS = CoalescingCache(fetch_areas, AREA_CACHE_TTL)
+
+
+def get_climate_entities():
+    """Get all climate entities, from the live cache when it is in sync.
+
+    Otherwise the REST result is shared for ``states_cache_ttl`` seconds and
+    concurrent callers wait for a single in-flight fetch. Returns None if
+    the fetch failed.
+    """
+    if STATE_CACHE.is_live():
+        return STATE_CACHE.entities()
+    return ENTITY_CACHE.get()
+
+
+def remember_setpoints(outcomes):
+    """Update cached entities with successfully written setpoints."""
+    written = {eid: temp for eid, (temp, error) in outcomes.items() if error is None}
+    if not written:
+        return
+
+    def apply(entities):
+        return [
+            {**e, "target_temperature": written[e["entity_id"]]} if e["entity_id"] in written else e
+            for e in entities
+        ]
+
+    ENTITY_CACHE.update(apply)
+    CHANGES.record(changed=written)
 
 
 def set_temperature(entity_id, temperature):
-    """Set the target temperature for a climate entity."""
+    """Set the target temperature for one or a list of climate entities.
+
+    Makes a single attempt and raises on failure; batches go through
+    ``submit_write``, which adds retries.
+    """
+    started = time.perf_counter()
     try:
-        resp = requests.post(
+        resp = HA_SESSION.post(
             f"{SUPERVISOR_URL}/services/climate/set_temperature",
-            headers=ha_headers(),
             json={
                 "entity_id": entity_id,
                 "temperature": temperature,
             },
-            timeout=10,
+            timeout=HA_TIMEOUT,
         )
         resp.raise_for_status()
-        return True, None
     except Exception as e:
-        error_msg = f"Fehler bei {entity_id}: {e}"
-        logger.error(error_msg)
-        return False, error_msg
+        HA_LATENCY.observe(time.perf_counter() - started, "set_temperature", "error")
+        HA_ERRORS.inc("set_temperature", error_class(e))
+        raise
+    HA_LATENCY.observe(time.perf_counter() - started, "set_temperature", "success")
+
+
+def read_duty_cycle_sensor():
+    """Read the access point's duty-cycle sensor (percent), None if unknown."""
+    resp = HA_SESSION.get(f"{SUPERVISOR_URL}/states/{OPTIONS['duty_cycle_sensor']}", timeout=HA_TIMEOUT)
+    resp.raise_for_status()
+    try:
+        return float(resp.json()["state"])
+    except (KeyError, ValueError):
+        return None
+
+
+DUTY_CYCLE = None
+if OPTIONS["duty_cycle_scheduler"]:
+    DUTY_CYCLE = DutyCycleScheduler(
+        set_temperature,
+        WRITE_EXECUTOR,
+        limit=float(OPTIONS["duty_cycle_limit"]),
+        cost_per_write=float(OPTIONS["duty_cycle_cost_per_write"]),
+        read_sensor=read_duty_cycle_sensor if OPTIONS["duty_cycle_sensor"] else None,
+    )
+    METRICS.gauge(
+        "thermostat_manager_duty_cycle_usage_percent",
+        "Estimated Homematic IP duty-cycle usage",
+        DUTY_CYCLE.usage,
+    )
+    METRICS.gauge(
+        "thermostat_manager_duty_cycle_pending_writes",
+        "Service calls waiting for duty-cycle budget",
+        DUTY_CYCLE.pending,
+    )
+
+
+# Waits for written setpoints to appear in Home Assistant's state
+CONFIRMATIONS = ConfirmationWatcher(setpoint_matches)
+# How often to refetch states for confirmations while the WebSocket is down
+CONFIRM_POLL_INTERVAL = 2.0
+# How often a batch waiting on a scheduled write checks whether a retry of
+# it got queued past duty_cycle_max_wait
+RETRY_ETA_POLL_INTERVAL = 0.25
+
+
+# Whole-fleet plans at least this large use the columnar planner (if NumPy
+# is installed and no writes are pending); below that the per-entity loop
+# is just as fast
+COLUMNAR_MIN_ENTITIES = 200
+
+_columns_lock = threading.Lock()
+_columns = None
+_columns_key = None
+
+
+def entity_columns(seq, entities):
+    """Return the setpoint columns for ``entities``, cached like ``entity_index``."""
+    global _columns, _columns_key
+    with _columns_lock:
+        if _columns_key != seq:
+            _columns = SetpointColumns(entities)
+            _columns_key = seq
+        return _columns
+
+
+def plan_request(selected_ids, offset=None, temperature=None):
+    """Fetch the selected thermostats and their originals once and plan the writes.
+
+    Pass either ``offset`` or ``temperature``. The returned WritePlan serves
+    validation, saving originals, dispatch and the response alike; selected
+    thermostats that could not be fetched are listed in its ``fetch_errors``.
+    """
+    seq = CHANGES.seq
+    if selected_ids:
+        entities, fetch_errors = lookup_entities(selected_ids)
+    else:
+        entities, fetch_errors = get_climate_entities(), []
+        if entities is None:
+            entities, fetch_errors = [], ["Fehler beim Abrufen der Climate-Entities"]
+    originals = load_originals()
+    pending = pending_setpoints()
+    if (
+        not selected_ids
+        and not pending
+        and setpoint_columns.BACKEND == "numpy"
+        and len(entities) >= COLUMNAR_MIN_ENTITIES
+    ):
+        columns = entity_columns(seq, entities)
+        return plan_from_columns(columns, originals, offset, temperature)
+
+    if offset is not None:
+        def target_for(entity):
+            current = entity["target_temperature"]
+            return current + offset if current is not None else None
+    else:
+        def target_for(entity):
+            return temperature
+    plan = plan_writes(entities, originals, target_for, pending)
+    plan.fetch_errors = fetch_errors
+    return plan
+
+
+def pending_setpoints():
+    """Setpoints the duty-cycle scheduler still has to send, by entity_id."""
+    return DUTY_CYCLE.pending_setpoints() if DUTY_CYCLE else {}
+
+
+def no_selection_response(plan):
+    """Response for a bulk request that found no thermostats to act on."""
+    payload = {"success": False, "error": "Keine Thermostate ausgewählt"}
+    if plan.fetch_errors:
+        payload["errors"] = plan.fetch_errors
+    return jsonify(payload)
+
+
+def save_new_originals(plan):
+    """Save the originals the plan found missing; no store access if none are."""
+    if not plan.new_originals:
+        return
+    with ORIGINALS.modify() as originals:
+        for entity_id, temperature in plan.new_originals.items():
+            originals.setdefault(entity_id, temperature)
+
+
+def skipped_note(skipped):
+    """Message suffix for targets that needed no change."""
+    return f", {len(skipped)} bereits eingestellt" if skipped else ""
+
+
+def group_by_temperature(targets):
+    """Group (entity_id, temperature) pairs into {temperature: [entity_ids]}."""
+    groups = {}
+    for entity_id, temperature in targets:
+        groups.setdefault(temperature, []).append(entity_id)
+    return groups
+
+
+class DispatchResult:
+    """Per-entity results of a batch of setpoint writes.
+
+    ``outcomes`` maps entity_id to ``(temperature, error)`` with error None on
+    success; ``queued`` maps entity_id to ``(temperature, eta)`` for writes
+    the duty-cycle scheduler is still holding back; ``retries`` counts the
+    retries spent per entity. ``unconfirmed`` lists entities whose write
+    succeeded but never showed up in the state (confirm mode only), and
+    ``superseded`` those whose write a newer one replaced before it was sent.
+    """
+
+    def __init__(self):
+        self.outcomes = {}
+        self.queued = {}
+        self.retries = {}
+        self.unconfirmed = []
+        self.superseded = []
+
+    @property
+    def applied(self):
+        return sum(1 for _, error in self.outcomes.values() if error is None) - len(self.unconfirmed)
+
+    @property
+    def errors(self):
+        return [error for _, error in self.outcomes.values() if error is not None]
+
+
+def submit_write(entity_ids, temperature, priority, version=None):
+    """Submit one service call, paced by the duty-cycle scheduler if enabled.
+
+    Transient failures are retried per ``RETRY``. Returns a Future with
+    ``eta`` and ``retries`` attributes; see ``write_error``. It resolves to
+    the entity_ids a newer write replaced (see ``DutyCycleScheduler``), or
+    None without the scheduler.
+    """
+    target = entity_ids if len(entity_ids) > 1 else entity_ids[0]
+
+    def submit_once():
+        if DUTY_CYCLE is None:
+            future = WRITE_EXECUTOR.submit(set_temperature, target, temperature)
+            future.eta = time.time()
+            return future
+        return DUTY_CYCLE.submit(entity_ids, temperature, priority, version)
+
+    def log_retry(retry, delay, error):
+        HA_RETRIES.inc("set_temperature")
+        logger.warning(
+            f"Setzen von {target} fehlgeschlagen ({error}), "
+            f"Wiederholung {retry}/{RETRY.retries} in {delay:.1f} s"
+        )
+
+    return RETRY.submit(submit_once, on_retry=log_retry)
+
+
+def write_error(future, target):
+    """Wait for a submitted write; return its error message or None."""
+    error = future.exception()
+    if error is None:
+        return None
+    message = f"Fehler bei {target}: {error}"
+    if future.retries:
+        message += f" (nach {future.retries} Wiederholungen)"
+    logger.error(message)
+    return message
+
+
+def released_in_time(future, deadline):
+    """Wait for a scheduled write; False once a retry of it is due only after ``deadline``."""
+    while True:
+        try:
+            future.exception(timeout=RETRY_ETA_POLL_INTERVAL)
+            return True
+        except FutureTimeoutError:
+            if future.eta > deadline:
+                return False
+
+
+def dispatch_set_temperature(targets, priority=PRIORITY_NORMAL, on_result=None):
+    """Set temperatures for (entity_id, temperature) pairs concurrently.
+
+    Entities sharing a final temperature are sent as one multi-entity
+    service call. Only if such a grouped call fails are its entities retried
+    individually, so every entity still gets its own result. Writes the
+    duty-cycle scheduler cannot start within ``duty_cycle_max_wait`` seconds,
+    first attempt or retry, are left queued and reported in
+    ``DispatchResult.queued``.
+
+    ``on_result(entity_id, error)`` is called as each entity's final result
+    comes in. With ``confirm_writes`` enabled, successful writes are then
+    awaited in Home Assistant's state; see ``await_confirmation``.
+    """
+    confirmation = CONFIRMATIONS.expect(dict(targets)) if OPTIONS["confirm_writes"] else None
+    max_group = DUTY_CYCLE.max_group_size() if DUTY_CYCLE else max(1, len(targets))
+    max_wait = float(OPTIONS["duty_cycle_max_wait"])
+    # One version for the whole batch, fallbacks included: they must not
+    # replace writes of requests that came in after this one
+    version = DUTY_CYCLE.next_version() if DUTY_CYCLE else None
+
+    def submit(ids, temp):
+        # Each write may wait up to max_wait from its own submission, so
+        # fallbacks sent after a slow grouped failure get the full budget
+        return temp, ids, submit_write(ids, temp, priority, version), time.time() + max_wait
+
+    pending = []
+    for temp, ids in group_by_temperature(targets).items():
+        for i in range(0, len(ids), max_group):
+            pending.append(submit(ids[i:i + max_group], temp))
+
+    results = {}
+    queued = {}
+    retries = {}
+    superseded = set()
+    while pending:
+        fallback = []
+        for temp, ids, future, deadline in pending:
+            if DUTY_CYCLE is not None and (
+                future.eta > deadline or not released_in_time(future, deadline)
+            ):
+                for entity_id in ids:
+                    queued[entity_id] = (temp, future.eta)
+                future.add_done_callback(lambda f, ids=ids, temp=temp: finish_deferred(ids, temp, f))
+                continue
+            error = write_error(future, ids if len(ids) > 1 else ids[0])
+            for entity_id in ids:
+                retries[entity_id] = retries.get(entity_id, 0) + future.retries
+            if error is None and future.result():
+                superseded.update(future.result())
+                ids = [entity_id for entity_id in ids if entity_id not in superseded]
+            if error is None or len(ids) == 1:
+                for entity_id in ids:
+                    results[entity_id] = error
+                    if on_result is not None:
+                        on_result(entity_id, error)
+            else:
+                logger.warning(f"Gruppenaufruf für {len(ids)} Thermostate fehlgeschlagen, setze einzeln")
+                for entity_id in ids:
+                    fallback.append(submit([entity_id], temp))
+        pending = fallback
+
+    result = DispatchResult()
+    result.retries = {entity_id: n for entity_id, n in retries.items() if n}
+    if confirmation is not None:
+        CONFIRMATIONS.discard_except(confirmation, {eid for eid, error in results.items() if error is None})
+        result.unconfirmed = await_confirmation(confirmation)
+        for entity_id in result.unconfirmed:
+            logger.warning(f"{entity_id}: Sollwert {dict(targets)[entity_id]:.1f}°C nicht bestätigt")
+    unconfirmed = set(result.unconfirmed)
+    for entity_id, temp in targets:
+        if entity_id in queued:
+            result.queued[entity_id] = queued[entity_id]
+        elif entity_id in superseded:
+            result.superseded.append(entity_id)
+        else:
+            result.outcomes[entity_id] = (temp, results[entity_id])
+            if results[entity_id] is not None:
+                ENTITY_WRITES.inc(entity_id, "error")
+            else:
+                ENTITY_WRITES.inc(entity_id, "unconfirmed" if entity_id in unconfirmed else "success")
+    remember_setpoints({eid: outcome for eid, outcome in result.outcomes.items() if eid not in unconfirmed})
+    return result
+
+
+def await_confirmation(confirmation):
+    """Wait until Home Assistant reports the expected setpoints.
+
+    State events from the WebSocket cache confirm writes as they arrive;
+    while it is down, the shared states cache is refetched every
+    ``CONFIRM_POLL_INTERVAL`` regardless of ``states_cache_ttl``, and
+    concurrent batches share one poll. Returns the entity_ids still
+    unconfirmed after ``confirm_timeout`` seconds.
+    """
+    deadline = time.monotonic() + float(OPTIONS["confirm_timeout"])
+    while not confirmation.done.is_set():
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        if not STATE_CACHE.is_live():
+            ENTITY_CACHE.get(max_age=CONFIRM_POLL_INTERVAL)
+        confirmation.done.wait(min(remaining, CONFIRM_POLL_INTERVAL))
+    return CONFIRMATIONS.wait(confirmation, 0)
+
+
+def finish_deferred(entity_ids, temperature, future):
+    """Record the outcome of a write the duty-cycle scheduler released late."""
+    error = write_error(future, entity_ids if len(entity_ids) > 1 else entity_ids[0])
+    if error is None and future.result():
+        entity_ids = [entity_id for entity_id in entity_ids if entity_id not in future.result()]
+        if not entity_ids:
+            return
+    outcomes = {entity_id: (temperature, error) for entity_id in entity_ids}
+    for entity_id in entity_ids:
+        ENTITY_WRITES.inc(entity_id, "success" if error is None else "error")
+    if error is None:
+        remember_setpoints(outcomes)
+    ORIGINALS.record_action("deferred", {"temperature": temperature}, outcomes)
+
+
+def batch_payload(message, result, skipped, fetch_errors=()):
+    """Build the JSON response body of a bulk write.
+
+    ``fetch_errors`` are reported with the write errors, for selected
+    thermostats that were left out because they could not be fetched.
+    """
+    payload = {"success": True, "skipped": skipped}
+    message += skipped_note(skipped)
+    if result.queued:
+        eta = max(eta for _, eta in result.queued.values())
+        message += f", {len(result.queued)} eingeplant bis {time.strftime('%H:%M', time.localtime(eta))}"
+        payload["queued"] = list(result.queued)
+        payload["expected_completion"] = datetime.fromtimestamp(eta, timezone.utc).isoformat()
+    if result.retries:
+        payload["retries"] = result.retries
+    if result.unconfirmed:
+        message += f", {len(result.unconfirmed)} nicht bestätigt"
+        payload["unconfirmed"] = result.unconfirmed
+    if result.superseded:
+        message += f", {len(result.superseded)} durch neueren Sollwert ersetzt"
+        payload["superseded"] = result.superseded
+    errors = list(fetch_errors) + result.errors
+    if errors:
+        message += f", {len(errors)} Fehler"
+        payload["errors"] = errors
+    payload["message"] = message
+    return payload
+
+
+def wants_async(data):
+    return bool(data.get("async")) or request.args.get("async") in ("1", "true")
+
+
+def run_batch(kind, targets, skipped, finish, priority=PRIORITY_NORMAL, run_async=False):
+    """Dispatch ``targets`` and respond with the payload ``finish(result)`` builds.
+
+    With ``run_async`` the writes run as a background job instead: the
+    response is 202 with the job id, and ``/api/jobs/<id>`` reports progress
+    and, once done, the same payload.
+    """
+    if not run_async:
+        return jsonify(finish(dispatch_set_temperature(targets, priority)))
+
+    job = JOBS.create(kind, targets, skipped)
+
+    def run():
+        try:
+            result = dispatch_set_temperature(
+                targets, priority, on_result=lambda eid, error: JOBS.entity_done(job, eid, error)
+            )
+            JOBS.finish(
+                job,
+                finish(result),
+                queued=result.queued,
+                unconfirmed=result.unconfirmed,
+                superseded=result.superseded,
+            )
+        except Exception as e:
+            logger.error(f"Job {job.id} ({kind}) fehlgeschlagen: {e}")
+            JOBS.finish(job, error=str(e))
+
+    JOB_EXECUTOR.submit(run)
+    return jsonify({
+        "success": True,
+        "job_id": job.id,
+        "message": f"Auftrag für {len(targets)} Thermostate gestartet{skipped_note(skipped)}",
+    }), 202
+
+
+def thermostat_view(entity, originals):
+    """Build the public representation of a climate entity."""
+    data = {
+        "entity_id": entity["entity_id"],
+        "name": entity["name"],
+        "current_temperature": entity["current_temperature"],
+        "target_temperature": entity["target_temperature"],
+        "hvac_mode": entity["hvac_mode"],
+    }
+    if originals and entity["entity_id"] in originals:
+        data["original_temperature"] = originals[entity["entity_id"]]
+    return data
+
+
+_published_views = {}
+_published_lock = threading.Lock()
+# Sequences every change of a thermostat's public data. Starting from the
+# clock in milliseconds keeps numbers handed out before a restart from
+# being mistaken for current ones.
+CHANGES = ChangeLog(start=time.time_ns() // 1_000_000)
+# Keeps /api/status validators from a previous process from matching
+BOOT_ID = uuid.uuid4().hex[:8]
+
+
+def publish_entity_changes(entities, removed=(), complete=False):
+    """Push thermostats that changed since the last publish to the stream.
+
+    With ``complete`` set, ``entities`` is a full snapshot and entities
+    missing from it are reported as removed.
+    """
+    CONFIRMATIONS.observe(entities)
+    changed = []
+    with _published_lock:
+        seen = set()
+        for entity in entities:
+            view = thermostat_view(entity, None)
+            seen.add(view["entity_id"])
+            if _published_views.get(view["entity_id"]) != view:
+                _published_views[view["entity_id"]] = view
+                changed.append(view)
+        gone = set(removed)
+        if complete:
+            gone.update(eid for eid in _published_views if eid not in seen)
+        for entity_id in gone:
+            _published_views.pop(entity_id, None)
+        CHANGES.record(changed=[view["entity_id"] for view in changed], removed=gone)
+
+    for view in changed:
+        EVENT_HUB.publish("thermostat", view)
+    for entity_id in gone:
+        EVENT_HUB.publish("thermostat_removed", {"entity_id": entity_id})
+
+
+_stream_poller_lock = threading.Lock()
+_stream_poller = None
+
+
+def ensure_stream_poller():
+    """Poll Home Assistant for stream subscribers while the cache is not live.
+
+    A single poller serves every connected client, so open tablets cost one
+    backend fetch per interval instead of one per client.
+    """
+    global _stream_poller
+    with _stream_poller_lock:
+        if _stream_poller is not None and _stream_poller.is_alive():
+            return
+        _stream_poller = threading.Thread(target=_poll_for_stream, name="stream-poller", daemon=True)
+        _stream_poller.start()
+
+
+def _poll_for_stream():
+    interval = float(OPTIONS["stream_poll_interval"])
+    while EVENT_HUB.subscriber_count():
+        if not STATE_CACHE.is_live():
+            ENTITY_CACHE.get()
+        time.sleep(interval)
+
+
+@app.after_request
+def count_request(response):
+    """Count handled requests per endpoint for /metrics."""
+    endpoint = request.url_rule.rule if request.url_rule else "unmatched"
+    HTTP_REQUESTS.inc(endpoint, request.method, str(response.status_code))
+    return response
+
+
+def conditional_response(etag, build):
+    """Answer 304 if the client already has ``etag``, else ``build()``."""
+    if request.if_none_match.contains_weak(etag):
+        response = Response(status=304)
+    else:
+        response = build()
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = "no-cache"
+    return response
+
+
+_index_lock = threading.Lock()
+_index = None
+_index_key = None
+
+
+def entity_index(seq, entities, areas, cache=True):
+    """Return the index for ``entities``, rebuilt only when something changed.
+
+    ``seq`` must be read before ``entities`` was fetched: an index built from
+    a newer snapshot than its key is merely rebuilt once more, never stale.
+    Pass ``cache=False`` for a stand-in snapshot (e.g. no areas because
+    their fetch failed): a recovery that changes nothing does not move
+    ``seq``, so a cached index from it would be served on and on.
+    """
+    global _index, _index_key
+    if not cache:
+        return EntityIndex(entities, areas)
+    key = (seq, areas is not None)
+    with _index_lock:
+        if _index_key != key:
+            _index = EntityIndex(entities, areas)
+            _index_key = key
+        return _index
+
+
+THERMOSTAT_FIELDS = (
+    "entity_id", "name", "current_temperature", "target_temperature",
+    "hvac_mode", "original_temperature", "area",
+)
+
+
+def parse_thermostat_query(args):
+    """Parse the filter, projection and paging parameters of /api/thermostats.
+
+    Raises ValueError with a message for the client on invalid input.
+    """
+    def split(name):
+        value = args.get(name)
+        return [part.strip() for part in value.split(",") if part.strip()] if value else None
+
+    query = {
+        "prefixes": split("prefix"),
+        "areas": split("area"),
+        "modes": split("hvac_mode"),
+        "fields": split("fields"),
+    }
+    unknown = [field for field in query["fields"] or () if field not in THERMOSTAT_FIELDS]
+    if unknown:
+        raise ValueError(f"Unbekannte Felder: {', '.join(unknown)}")
+    for name in ("offset", "limit", "since"):
+        value = args.get(name)
+        try:
+            query[name] = int(value) if value is not None else None
+        except ValueError:
+            raise ValueError(f"Ungültiger Wert für {name}") from None
+        # limit=0 would hand out next_offset == offset and page forever
+        minimum = {"offset": 0, "limit": 1}.get(name)
+        if minimum is not None and query[name] is not None and query[name] < minimum:
+            raise ValueError(f"Ungültiger Wert für {name}")
+    return query
+
+
+def project(view, fields, areas):
+    if areas is not None:
+        view["area"] = areas.get(view["entity_id"])
+    if fields is None:
+        return view
+    return {field: view[field] for field in fields if field in view}
 
 
 @app.route("/")
@@ -135,91 +1177,155 @@ def index():
 
 @app.route("/api/thermostats")
 def get_thermostats():
-    """Get all climate entities with current and original temperatures."""
+    """Get all climate entities with current and original temperatures.
+
+    With ``since=<seq>`` only thermostats added or changed after that change
+    sequence number are returned, plus the ids of removed ones. If ``seq``
+    is too old to answer incrementally, the full list comes back with
+    ``full`` set. Every response carries the ``seq`` to pass next time.
+    """
+    try:
+        query = parse_thermostat_query(request.args)
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+
+    wants_areas = query["areas"] is not None or (query["fields"] is not None and "area" in query["fields"])
+    areas = AREAS.get() if wants_areas else None
+    # Without areas the list is still served, but neither cached nor tagged
+    areas_failed = wants_areas and areas is None
+    if areas_failed:
+        areas = {}
+    # Read before fetching: changes racing with this request are sent again
+    # next time rather than lost, and the ETag names this version, not a
+    # later one the body may not contain yet
+    seq = CHANGES.seq
+    generation = ORIGINALS.generation
     entities = get_climate_entities()
+    if entities is None:
+        # No validator: after recovery seq and generation may be unchanged,
+        # and a tagged error would turn every later poll into a 304
+        return jsonify({"success": False, "error": "Thermostate konnten nicht abgerufen werden"}), 502
     originals = load_originals()
+    index = entity_index(seq, entities, areas, cache=not areas_failed)
+    selected = index.select(query["prefixes"], query["areas"], query["modes"])
 
-    result = []
-    for entity in entities:
-        data = {
-            "entity_id": entity["entity_id"],
-            "name": entity["name"],
-            "current_temperature": entity["current_temperature"],
-            "target_temperature": entity["target_temperature"],
-            "hvac_mode": entity["hvac_mode"],
-        }
-        if originals and entity["entity_id"] in originals:
-            data["original_temperature"] = originals[entity["entity_id"]]
-        result.append(data)
+    delta = CHANGES.since(query["since"]) if query["since"] is not None else None
+    if delta is not None:
+        changed, removed = delta
+        return jsonify({
+            "success": True,
+            "seq": seq,
+            "full": False,
+            "thermostats": [
+                project(thermostat_view(index.entities[eid], originals), query["fields"], areas)
+                for eid in selected if eid in changed
+            ],
+            "removed": removed,
+        })
 
-    return jsonify({"success": True, "thermostats": result})
+    total = len(selected)
+    offset = query["offset"] or 0
+    end = total if query["limit"] is None else offset + query["limit"]
+    page = selected[offset:end]
+
+    def build():
+        result = [
+            project(thermostat_view(index.entities[eid], originals), query["fields"], areas)
+            for eid in page
+        ]
+        payload = {"success": True, "seq": seq, "full": True, "total": total, "thermostats": result}
+        if query["limit"] is not None or offset:
+            payload["offset"] = offset
+            payload["next_offset"] = end if end < total else None
+        return jsonify(payload)
+
+    if areas_failed:
+        return build()
+    return conditional_response(f"{seq}-{generation}", build)
+
+
+@app.route("/api/thermostats/<entity_id>")
+def get_thermostat(entity_id):
+    """Get one climate entity with its original temperature."""
+    entities, errors = lookup_entities([entity_id])
+    if errors:
+        return jsonify({"success": False, "error": errors[0]}), 502
+    if not entities:
+        return jsonify({"success": False, "error": "Thermostat nicht gefunden"}), 404
+    return jsonify({"success": True, "thermostat": thermostat_view(entities[0], load_originals())})
+
+
+@app.route("/api/thermostats/<entity_id>", methods=["PUT"])
+def update_thermostat(entity_id):
+    """Set one thermostat to an absolute temperature or by an offset."""
+    data = request.json or {}
+    entities, errors = lookup_entities([entity_id])
+    if errors:
+        return jsonify({"success": False, "error": errors[0]}), 502
+    if not entities:
+        return jsonify({"success": False, "error": "Thermostat nicht gefunden"}), 404
+    entity = entities[0]
+
+    if data.get("temperature") is not None:
+        kind = "absolute"
+        params = {"temperature": float(data["temperature"])}
+        temperature = params["temperature"]
+    elif data.get("offset"):
+        if entity["target_temperature"] is None:
+            return jsonify({"success": False, "error": "Thermostat hat keine Solltemperatur"})
+        kind = "offset"
+        params = {"offset": float(data["offset"])}
+        temperature = entity["target_temperature"] + params["offset"]
+    else:
+        return jsonify({"success": False, "error": "Keine Temperatur oder Offset angegeben"})
+
+    plan = plan_writes(entities, load_originals(), lambda e: temperature, pending_setpoints())
+    save_new_originals(plan)
+    result = dispatch_set_temperature(plan.targets)
+    ORIGINALS.record_action(kind, params, result.outcomes)
+
+    temperature = final_setpoint(entity, temperature)
+    if plan.skipped:
+        payload = batch_payload(f"{entity['name']} steht bereits auf {temperature:.1f}°C", result, [])
+        payload["skipped"] = plan.skipped
+    else:
+        payload = batch_payload(f"{entity['name']} auf {temperature:.1f}°C gesetzt", result, plan.skipped)
+    return jsonify(payload)
 
 
 @app.route("/api/apply_offset", methods=["POST"])
 def apply_offset():
     """Apply a temperature offset to selected thermostats."""
-    data = request.json
+    data = request.json or {}
     offset = float(data.get("offset", 0))
     selected_ids = data.get("entity_ids", None)
 
     if offset == 0:
         return jsonify({"success": False, "error": "Offset darf nicht 0 sein"})
 
-    entities = get_climate_entities()
-    originals = load_originals()
-
-    # Filter to selected entities if provided
-    if selected_ids:
-        selected_set = set(selected_ids)
-        target_entities = [e for e in entities if e["entity_id"] in selected_set]
-    else:
-        target_entities = entities
-
-    if not target_entities:
-        return jsonify({"success": False, "error": "Keine Thermostate ausgewählt"})
-
-    # Save originals (merge with existing if already present)
-    if originals is None:
-        originals = {}
-    for entity in target_entities:
-        if entity["target_temperature"] is not None and entity["entity_id"] not in originals:
-            originals[entity["entity_id"]] = entity["target_temperature"]
-    save_originals(originals)
-
-    errors = []
-    applied = 0
-
-    for entity in target_entities:
-        if entity["target_temperature"] is None:
-            continue
-
-        new_temp = entity["target_temperature"] + offset
-        # Clamp to thermostat min/max
-        new_temp = max(entity["min_temp"], min(entity["max_temp"], new_temp))
-
-        success, error = set_temperature(entity["entity_id"], new_temp)
-        if success:
-            applied += 1
-        else:
-            errors.append(error)
+    # Thermostats without a setpoint are left alone; those already at their
+    # min/max limit end up skipped
+    plan = plan_request(selected_ids, offset=offset)
+    if not plan.entities:
+        return no_selection_response(plan)
+    save_new_originals(plan)
+
+    def finish(result):
+        ORIGINALS.record_action("offset", {"offset": offset}, result.outcomes)
+        return batch_payload(
+            f"Offset {offset:+.1f}°C auf {result.applied} Thermostate angewendet",
+            result,
+            plan.skipped,
+            plan.fetch_errors,
+        )
 
-    if errors:
-        return jsonify({
-            "success": True,
-            "message": f"Offset auf {applied} Thermostate angewendet, {len(errors)} Fehler",
-            "errors": errors,
-        })
-
-    return jsonify({
-        "success": True,
-        "message": f"Offset {offset:+.1f}°C auf {applied} Thermostate angewendet",
-    })
+    return run_batch("offset", plan.targets, plan.skipped, finish, run_async=wants_async(data))
 
 
 @app.route("/api/set_temperature", methods=["POST"])
 def set_absolute_temperature():
     """Set an absolute temperature on selected thermostats."""
-    data = request.json
+    data = request.json or {}
     temperature = data.get("temperature")
     selected_ids = data.get("entity_ids", None)
 
@@ -227,47 +1333,46 @@ def set_absolute_temperature():
         return jsonify({"success": False, "error": "Keine Temperatur angegeben"})
 
     temperature = float(temperature)
-    entities = get_climate_entities()
-
-    # Filter to selected entities if provided
-    if selected_ids:
-        selected_set = set(selected_ids)
-        target_entities = [e for e in entities if e["entity_id"] in selected_set]
-    else:
-        target_entities = entities
-
-    if not target_entities:
-        return jsonify({"success": False, "error": "Keine Thermostate ausgewählt"})
-
-    # Save originals before changing (merge with existing)
-    originals = load_originals() or {}
-    for entity in target_entities:
-        if entity["target_temperature"] is not None and entity["entity_id"] not in originals:
-            originals[entity["entity_id"]] = entity["target_temperature"]
-    save_originals(originals)
-
-    errors = []
-    applied = 0
+    plan = plan_request(selected_ids, temperature=temperature)
+    if not plan.entities:
+        return no_selection_response(plan)
+    save_new_originals(plan)
+
+    def finish(result):
+        ORIGINALS.record_action("absolute", {"temperature": temperature}, result.outcomes)
+        return batch_payload(
+            f"{result.applied} Thermostate auf {temperature:.1f}°C gesetzt",
+            result,
+            plan.skipped,
+            plan.fetch_errors,
+        )
 
-    for entity in target_entities:
-        new_temp = max(entity["min_temp"], min(entity["max_temp"], temperature))
-        success, error = set_temperature(entity["entity_id"], new_temp)
-        if success:
-            applied += 1
-        else:
-            errors.append(error)
+    return run_batch("absolute", plan.targets, plan.skipped, finish, run_async=wants_async(data))
 
-    if errors:
-        return jsonify({
-            "success": True,
-            "message": f"{applied} Thermostate auf {temperature:.1f}°C gesetzt, {len(errors)} Fehler",
-            "errors": errors,
-        })
 
-    return jsonify({
+@app.route("/api/plan", methods=["POST"])
+def what_if():
+    """Show what an offset or absolute temperature would change, without writing."""
+    data = request.json or {}
+    offset = data.get("offset")
+    temperature = data.get("temperature")
+    if (offset is None) == (temperature is None):
+        return jsonify({"success": False, "error": "Entweder offset oder temperature angeben"}), 400
+
+    plan = plan_request(
+        data.get("entity_ids"),
+        offset=float(offset) if offset is not None else None,
+        temperature=float(temperature) if temperature is not None else None,
+    )
+    payload = {
         "success": True,
-        "message": f"{applied} Thermostate auf {temperature:.1f}°C gesetzt",
-    })
+        "changes": [{"entity_id": eid, "temperature": temp} for eid, temp in plan.targets],
+        "skipped": plan.skipped,
+        "new_originals": len(plan.new_originals),
+    }
+    if plan.fetch_errors:
+        payload["errors"] = plan.fetch_errors
+    return jsonify(payload)
 
 
 @app.route("/api/restore", methods=["POST"])
@@ -284,47 +1389,108 @@ def restore():
     if selected_ids:
         to_restore = {eid: temp for eid, temp in originals.items() if eid in selected_ids}
     else:
-        to_restore = originals
-
-    errors = []
-    restored = 0
-
-    for entity_id, temperature in to_restore.items():
-        success, error = set_temperature(entity_id, temperature)
-        if success:
-            restored += 1
-        else:
-            errors.append(error)
-
-    # Remove restored entries from originals
-    if not errors:
-        for eid in to_restore:
-            originals.pop(eid, None)
-        if originals:
-            save_originals(originals)
-        else:
-            delete_originals()
-        return jsonify({
-            "success": True,
-            "message": f"{restored} Thermostate auf Originaltemperaturen zurückgesetzt",
-        })
-
-    return jsonify({
-        "success": True,
-        "message": f"{restored} wiederhergestellt, {len(errors)} Fehler",
-        "errors": errors,
-    })
+        to_restore = dict(originals)
+
+    # Entities that fail to fetch are written anyway, just not checked for no-ops
+    entities, _ = lookup_entities(list(to_restore))
+    entities_by_id = {e["entity_id"]: e for e in entities}
+    # Compare against writes still queued too: a room whose newer setpoint
+    # is only pending is not back at its original yet
+    targets, skipped = split_noop_targets(list(to_restore.items()), entities_by_id, pending_setpoints())
+
+    def finish(result):
+        ORIGINALS.record_action("restore", {}, result.outcomes)
+
+        # Remove restored entries from originals; queued, unconfirmed and
+        # superseded ones stay until a later restore
+        if not result.errors:
+            keep = set(result.queued) | set(result.unconfirmed) | set(result.superseded)
+            with ORIGINALS.modify() as originals:
+                for eid in to_restore:
+                    if eid not in keep:
+                        originals.pop(eid, None)
+            return batch_payload(
+                f"{result.applied} Thermostate auf Originaltemperaturen zurückgesetzt", result, skipped
+            )
+
+        return batch_payload(f"{result.applied} wiederhergestellt", result, skipped)
+
+    return run_batch(
+        "restore", targets, skipped, finish, priority=PRIORITY_HIGH, run_async=wants_async(data)
+    )
+
+
+@app.route("/api/jobs/<job_id>")
+def get_job(job_id):
+    """Report progress and result of a background bulk operation."""
+    job = JOBS.get(job_id)
+    if job is None:
+        return jsonify({"success": False, "error": "Auftrag nicht gefunden"}), 404
+    return jsonify({"success": True, **JOBS.snapshot(job)})
 
 
 @app.route("/api/status")
 def status():
     """Check if original temperatures are saved."""
+    generation = ORIGINALS.generation
     originals = load_originals()
-    return jsonify({
-        "success": True,
-        "offset_active": originals is not None,
-        "saved_count": len(originals) if originals else 0,
-    })
+    return conditional_response(
+        f"{BOOT_ID}-{generation}",
+        lambda: jsonify({"success": True, **status_payload(originals)}),
+    )
+
+
+@app.route("/api/history")
+def history():
+    """List recorded per-entity outcomes of applied actions."""
+    since = request.args.get("since", type=float)
+    limit = max(1, min(request.args.get("limit", 100, type=int), 1000))
+    entries = ORIGINALS.history(request.args.get("entity_id"), since, limit)
+    return jsonify({"success": True, "history": entries})
+
+
+@app.route("/api/stream")
+def stream():
+    """Stream thermostat and offset status changes as Server-Sent Events.
+
+    Answers 503 once ``MAX_STREAMS`` clients are connected; the UI then
+    polls instead.
+    """
+    if STREAM_SLOTS is None or not STREAM_SLOTS.acquire(blocking=False):
+        logger.warning(f"Live-Verbindung abgelehnt, bereits {MAX_STREAMS} Clients verbunden")
+        return jsonify({"success": False, "error": "Zu viele Live-Verbindungen"}), 503
+
+    def generate():
+        events = EVENT_HUB.subscribe()
+        ensure_stream_poller()
+        try:
+            yield "retry: 5000\n\n"
+            originals = load_originals()
+            yield format_sse("status", {**status_payload(originals), "originals": originals or {}})
+            while True:
+                try:
+                    event, data = events.get(timeout=STREAM_KEEPALIVE)
+                except queue.Empty:
+                    yield ": keepalive\n\n"
+                    continue
+                yield format_sse(event, data)
+        finally:
+            EVENT_HUB.unsubscribe(events)
+
+    response = Response(
+        generate(),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+    # Runs when the server closes the response, even if the stream never started
+    response.call_on_close(STREAM_SLOTS.release)
+    return response
+
+
+@app.route("/metrics")
+def metrics():
+    """Expose metrics in the Prometheus text format."""
+    return Response(METRICS.render(), mimetype="text/plain; version=0.0.4")
 
 
 @app.route("/api/debug")
@@ -355,15 +1521,26 @@ def debug():
         "supervisor_token_set": bool(SUPERVISOR_TOKEN),
         "supervisor_token_length": len(SUPERVISOR_TOKEN),
         "supervisor_url": SUPERVISOR_URL,
+        "state_cache_live": STATE_CACHE.is_live(),
+        "state_cache_entities": len(STATE_CACHE),
+        "http_pool": ha_pool_stats(),
+        "streams": {"connected": EVENT_HUB.subscriber_count(), "max": MAX_STREAMS},
+        "states_fetch": OPTIONS["states_fetch"],
+        "template_available": time.monotonic() >= _template_retry_at,
+        "states_cache": ENTITY_CACHE.stats(),
+        "json_backend": json_backend.BACKEND,
+        "planner_backend": setpoint_columns.BACKEND,
+        "jobs": JOBS.stats(),
+        "pending_confirmations": CONFIRMATIONS.pending(),
+        "duty_cycle": {
+            "usage": DUTY_CYCLE.usage(),
+            "pending_writes": DUTY_CYCLE.pending(),
+        } if DUTY_CYCLE else None,
         "all_env_var_names": all_env_names,
         "filesystem_check": found_paths,
     }
     try:
-        resp = requests.get(
-            f"{SUPERVISOR_URL}/states",
-            headers=ha_headers(),
-            timeout=10,
-        )
+        resp = HA_SESSION.get(f"{SUPERVISOR_URL}/states", timeout=HA_TIMEOUT)
         info["status_code"] = resp.status_code
         info["response_length"] = len(resp.text)
         if resp.status_code == 200:
@@ -379,5 +1556,43 @@ def debug():
     return jsonify(info)
 
 
+def shutdown():
+    """Stop background workers after the HTTP server has stopped."""
+    logger.info("Beende Hintergrunddienste")
+    STATE_CACHE.stop()
+    JOB_EXECUTOR.shutdown(wait=True)
+    WRITE_EXECUTOR.shutdown(wait=True)
+
+
+def serve(host="0.0.0.0", port=5000):
+    """Run the app with the server selected by the ``server`` option."""
+    STATE_CACHE.start()
+    try:
+        if OPTIONS["server"] == "development":
+            app.run(host=host, port=port, debug=False, threaded=True)
+            return
+
+        # Each open /api/stream client holds one worker thread, see MAX_STREAMS
+        server = create_server(
+            app,
+            host=host,
+            port=port,
+            threads=int(OPTIONS["server_threads"]),
+            connection_limit=int(OPTIONS["server_connection_limit"]),
+            channel_timeout=int(OPTIONS["server_keepalive_timeout"]),
+            ident="thermostat-manager",
+        )
+
+        def handle_sigterm(signum, frame):
+            # waitress finishes running tasks when its loop exits via SystemExit
+            raise SystemExit(0)
+
+        signal.signal(signal.SIGTERM, handle_sigterm)
+        logger.info(f"Starte Server auf {host}:{port} mit {OPTIONS['server_threads']} Threads")
+        server.run()
+    finally:
+        shutdown()
+
+
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=5000, debug=False)
+    serve(port=int(os.environ.get("PORT", 5000)))
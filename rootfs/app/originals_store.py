@@ -0,0 +1,128 @@
+"""Crash-safe, in-memory cached storage of original thermostat temperatures."""
+
+import logging
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
+
+import json_backend
+
+logger = logging.getLogger(__name__)
+
+
+class OriginalsStore:
+    """Keep the saved original temperatures in memory and on disk.
+
+    The file is only re-read when its mtime or size changed, written
+    atomically via temp file + fsync + rename, and only when the contents
+    actually changed. All access goes through one lock, so concurrent
+    requests cannot interleave read-modify-write cycles.
+
+    ``on_change`` is called with the new originals (or None) after each write.
+    """
+
+    def __init__(self, path, on_change=None):
+        self.path = path
+        self._on_change = on_change
+        self._lock = threading.RLock()
+        self._originals = None
+        self._stamp = None
+        self.generation = 0
+
+    def _file_stamp(self):
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return (st.st_mtime_ns, st.st_size)
+
+    def _refresh(self):
+        stamp = self._file_stamp()
+        if stamp == self._stamp:
+            return
+        if stamp is None:
+            self._originals = None
+        else:
+            with open(self.path, "r") as f:
+                self._originals = json_backend.loads(f.read())
+        self._stamp = stamp
+        self.generation += 1
+
+    def load(self):
+        """Return a copy of the saved originals, or None if none are saved."""
+        with self._lock:
+            self._refresh()
+            return dict(self._originals) if self._originals is not None else None
+
+    @contextmanager
+    def modify(self):
+        """Yield a mutable copy of the originals and persist it on exit.
+
+        An empty dict on exit removes the file.
+        """
+        with self._lock:
+            self._refresh()
+            originals = dict(self._originals or {})
+            yield originals
+            new = originals or None
+            if new == self._originals:
+                return
+            if new is None:
+                self._remove()
+            else:
+                self._write(new)
+            self._originals = new
+            self._stamp = self._file_stamp()
+            self.generation += 1
+        if self._on_change is not None:
+            self._on_change(dict(new) if new else None)
+
+    def delete(self):
+        """Remove all saved originals."""
+        with self.modify() as originals:
+            originals.clear()
+
+    def record_action(self, kind, params, outcomes):
+        """The JSON store keeps no action history."""
+        return None
+
+    def history(self, entity_id=None, since=None, limit=100):
+        return []
+
+    def _write(self, originals):
+        directory = os.path.dirname(self.path)
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".original_temps.", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w") as f:
+                f.write(json_backend.dumps(originals, indent=True))
+                f.flush()
+                os.fsync(f.fileno())
+            # mkstemp creates 0600; keep the permissions of a plain open()
+            os.chmod(tmp_path, 0o644)
+            os.replace(tmp_path, self.path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        _fsync_dir(directory)
+
+    def _remove(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+            _fsync_dir(os.path.dirname(self.path))
+
+
+def _fsync_dir(directory):
+    """Persist a rename or unlink in ``directory``."""
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError as e:
+        logger.debug(f"fsync für {directory} nicht möglich: {e}")
+    finally:
+        os.close(fd)
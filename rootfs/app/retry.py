@@ -0,0 +1,113 @@
+"""Retries with exponential backoff and jitter for Home Assistant API calls."""
+
+import random
+import threading
+import time
+from concurrent.futures import Future
+
+import requests
+
+
+def is_transient(e):
+    """Whether ``e`` is worth retrying: connection trouble, timeouts, 5xx and 429."""
+    if isinstance(e, (requests.ConnectionError, requests.Timeout)):
+        return True
+    response = getattr(e, "response", None)
+    if response is not None:
+        return response.status_code >= 500 or response.status_code == 429
+    return False
+
+
+class RetryPolicy:
+    """Up to ``retries`` further attempts after a transient failure.
+
+    The n-th retry waits a random time between 0 and
+    ``min(max_delay, base_delay * 2**n)`` ("full jitter"), and no retry is
+    started that would begin more than ``deadline`` seconds after the first
+    attempt.
+    """
+
+    def __init__(self, retries, base_delay, max_delay, deadline):
+        self.retries = retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.deadline = deadline
+
+    def backoff(self, retry):
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** retry))
+
+    def _next_delay(self, retry, error, started):
+        """Delay before retry number ``retry``, or None to give up."""
+        if retry >= self.retries or not is_transient(error):
+            return None
+        delay = self.backoff(retry)
+        if time.monotonic() + delay > started + self.deadline:
+            return None
+        return delay
+
+    def call(self, fn, on_retry=None):
+        """Call ``fn()`` until it succeeds or the policy gives up.
+
+        ``on_retry(retry, delay, error)`` is called before each retry. The
+        last exception is re-raised when giving up.
+        """
+        started = time.monotonic()
+        retry = 0
+        while True:
+            try:
+                return fn()
+            except Exception as e:
+                delay = self._next_delay(retry, e, started)
+                if delay is None:
+                    raise
+                if on_retry is not None:
+                    on_retry(retry + 1, delay, e)
+                time.sleep(delay)
+                retry += 1
+
+    def submit(self, submit_once, on_retry=None):
+        """Run ``submit_once()`` (returning a Future) with retries.
+
+        Waits between attempts happen on timers rather than in a worker, so
+        a backing-off call does not hold up the rest of a batch. Returns a
+        Future resolving like the last attempt; its ``retries`` attribute
+        counts the retries made and ``eta`` follows the latest attempt, so
+        a retry queued behind others moves it back.
+        """
+        outer = Future()
+        outer.retries = 0
+
+        def attempt():
+            inner = submit_once()
+            outer.eta = getattr(inner, "eta", time.time())
+            inner.add_done_callback(done)
+            return inner
+
+        def retry_attempt():
+            try:
+                attempt()
+            except Exception as e:
+                # E.g. the executor shut down while we were backing off
+                outer.set_exception(e)
+
+        def done(inner):
+            error = inner.exception()
+            if error is None:
+                outer.set_result(inner.result())
+                return
+            delay = self._next_delay(outer.retries, error, outer.started)
+            if delay is None:
+                outer.set_exception(error)
+                return
+            outer.retries += 1
+            if on_retry is not None:
+                on_retry(outer.retries, delay, error)
+            timer = threading.Timer(delay, retry_attempt)
+            timer.daemon = True
+            timer.start()
+
+        # The deadline counts from when the write may actually start
+        outer.started = time.monotonic()
+        attempt()
+        outer.started += max(0.0, outer.eta - time.time())
+        return outer
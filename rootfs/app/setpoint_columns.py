@@ -0,0 +1,130 @@
+"""Columnar setpoint planning for large numbers of thermostats.
+
+Setpoints, limits and step sizes are held as float columns: NumPy arrays
+when NumPy is installed, ``array("d")`` otherwise. With NumPy, offset,
+clamping, step rounding and the change mask run as whole-column operations;
+the fallback walks the columns in Python with the same results.
+
+Missing setpoints are stored as NaN.
+"""
+
+import math
+from array import array
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from write_plan import DEFAULT_TEMP_STEP, WritePlan, round_to_step
+
+BACKEND = "numpy" if numpy is not None else "array"
+
+NAN = float("nan")
+
+
+def _column(values):
+    if numpy is not None:
+        return numpy.array(values, dtype=numpy.float64)
+    return array("d", values)
+
+
+class SetpointColumns:
+    """Current setpoints and limits of a snapshot of climate entities.
+
+    ``entities`` maps entity_id to the entity and ``setpoints`` to its
+    current setpoint, for entities that have one.
+    """
+
+    def __init__(self, entities):
+        self.entity_ids = []
+        self.entities = {}
+        self.setpoints = {}
+        current, min_temp, max_temp, step = [], [], [], []
+        for entity in entities:
+            entity_id = entity["entity_id"]
+            self.entity_ids.append(entity_id)
+            self.entities[entity_id] = entity
+            target = entity["target_temperature"]
+            if target is not None:
+                self.setpoints[entity_id] = target
+            current.append(NAN if target is None else target)
+            min_temp.append(entity["min_temp"])
+            max_temp.append(entity["max_temp"])
+            step.append(entity.get("target_temp_step") or DEFAULT_TEMP_STEP)
+        self.current = _column(current)
+        self.min_temp = _column(min_temp)
+        self.max_temp = _column(max_temp)
+        self.step = _column(step)
+        if numpy is not None:
+            self._ids = numpy.array(self.entity_ids, dtype=object)
+
+    def __len__(self):
+        return len(self.entity_ids)
+
+    def plan(self, offset=None, temperature=None):
+        """Plan an offset or an absolute temperature for every row.
+
+        Returns ``(targets, skipped)`` like ``split_noop_targets``: the
+        (entity_id, temperature) writes that change something, with the
+        temperature rounded to the entity's step size and clamped to its
+        limits like ``final_setpoint``, and the entity_ids
+        already at that setpoint. With an offset, rows without a setpoint
+        are left out.
+        """
+        if (offset is None) == (temperature is None):
+            raise ValueError("Genau eines von offset und temperature angeben")
+        if numpy is not None:
+            return self._plan_numpy(offset, temperature)
+        return self._plan_loop(offset, temperature)
+
+    def _plan_numpy(self, offset, temperature):
+        np = numpy
+        if offset is not None:
+            desired = self.current + offset
+        else:
+            desired = np.full(len(self), float(temperature))
+        # round_to_step per element; np.round and round() agree on step multiples
+        rounded = np.round(np.rint(desired / self.step) * self.step, 2)
+        target = np.maximum(self.min_temp, np.minimum(self.max_temp, rounded))
+        valid = ~np.isnan(desired)
+        # Same setpoint at the device's step size; rint rounds half to even
+        # like round(), and NaN never compares equal
+        same = (self.current == target) | (np.rint(self.current / self.step) == np.rint(target / self.step))
+        changed = valid & ~same
+        targets = list(zip(self._ids[changed].tolist(), target[changed].tolist()))
+        skipped = self._ids[valid & same].tolist()
+        return targets, skipped
+
+    def _plan_loop(self, offset, temperature):
+        targets = []
+        skipped = []
+        for i, entity_id in enumerate(self.entity_ids):
+            current = self.current[i]
+            if offset is not None:
+                if math.isnan(current):
+                    continue
+                desired = current + offset
+            else:
+                desired = float(temperature)
+            step = self.step[i]
+            target = max(self.min_temp[i], min(self.max_temp[i], round_to_step(desired, step)))
+            if current == target or (
+                not math.isnan(current) and round_to_step(current, step) == round_to_step(target, step)
+            ):
+                skipped.append(entity_id)
+            else:
+                targets.append((entity_id, target))
+        return targets, skipped
+
+
+def plan_from_columns(columns, originals, offset=None, temperature=None):
+    """Build a WritePlan for every entity in ``columns``, like ``plan_writes``."""
+    plan = WritePlan(originals)
+    plan.entities = columns.entities
+    saved = plan.originals
+    plan.new_originals = {
+        entity_id: current for entity_id, current in columns.setpoints.items() if entity_id not in saved
+    }
+    plan.targets, plan.skipped = columns.plan(offset, temperature)
+    return plan
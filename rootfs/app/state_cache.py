@@ -0,0 +1,177 @@
+"""In-memory cache of Home Assistant climate entities fed by the WebSocket API."""
+
+import json
+import logging
+import threading
+
+import json_backend
+
+try:
+    import websocket
+except ImportError:
+    websocket = None
+
+logger = logging.getLogger(__name__)
+
+RECONNECT_MIN_DELAY = 1
+RECONNECT_MAX_DELAY = 60
+PING_INTERVAL = 30
+
+
+class ClimateStateCache:
+    """Keep an authoritative dict of climate entities up to date.
+
+    A background thread subscribes to ``state_changed`` events and applies
+    every climate update to the in-process dict. After each (re)connect the
+    dict is rebuilt from a full fetch via ``resync``, so events missed while
+    disconnected cannot leave stale entries behind. Entity dicts are replaced,
+    never mutated, so readers may keep references without holding the lock.
+
+    ``listener`` is called with ``(entities, removed_ids)`` after every
+    applied event.
+    """
+
+    def __init__(self, ws_url, token, convert, resync, listener=None):
+        self.ws_url = ws_url
+        self.token = token
+        self._convert = convert
+        self._resync = resync
+        self._listener = listener
+        self._entities = {}
+        self._lock = threading.Lock()
+        self._live = threading.Event()
+        self._stopping = threading.Event()
+        self._thread = None
+        self._ws = None
+        self._next_id = 1
+
+    @property
+    def available(self):
+        return websocket is not None
+
+    def is_live(self):
+        """Return True while subscribed and in sync with Home Assistant."""
+        return self._live.is_set()
+
+    def entities(self):
+        """Return a snapshot list of all cached climate entities."""
+        with self._lock:
+            return list(self._entities.values())
+
+    def get(self, entity_id):
+        """Return one cached climate entity, or None."""
+        return self._entities.get(entity_id)
+
+    def __len__(self):
+        return len(self._entities)
+
+    def start(self):
+        if not self.available:
+            logger.warning("websocket-client nicht installiert, Zustands-Cache deaktiviert")
+            return
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="climate-state-cache", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopping.set()
+        self._live.clear()
+        ws = self._ws
+        if ws is not None:
+            try:
+                ws.close()
+            except Exception:
+                pass
+
+    def _run(self):
+        delay = RECONNECT_MIN_DELAY
+        while not self._stopping.is_set():
+            try:
+                self._session()
+                delay = RECONNECT_MIN_DELAY
+            except Exception as e:
+                if self._stopping.is_set():
+                    break
+                logger.warning(f"WebSocket-Verbindung getrennt: {e}, neuer Versuch in {delay}s")
+            finally:
+                self._live.clear()
+                self._ws = None
+            self._stopping.wait(delay)
+            delay = min(delay * 2, RECONNECT_MAX_DELAY)
+
+    def _send(self, ws, payload):
+        payload["id"] = self._next_id
+        self._next_id += 1
+        ws.send(json.dumps(payload))
+        return payload["id"]
+
+    def _session(self):
+        ws = websocket.create_connection(self.ws_url, timeout=PING_INTERVAL)
+        self._ws = ws
+        self._next_id = 1
+        try:
+            msg = json_backend.loads(ws.recv())
+            if msg.get("type") == "auth_required":
+                ws.send(json.dumps({"type": "auth", "access_token": self.token}))
+                msg = json_backend.loads(ws.recv())
+            if msg.get("type") != "auth_ok":
+                raise RuntimeError(f"Authentifizierung fehlgeschlagen: {msg.get('type')}")
+
+            sub_id = self._send(ws, {"type": "subscribe_events", "event_type": "state_changed"})
+            msg = json_backend.loads(ws.recv())
+            if msg.get("id") != sub_id or not msg.get("success"):
+                raise RuntimeError(f"Abonnement fehlgeschlagen: {msg}")
+
+            # Subscribe first, then fetch: events queued during the fetch are
+            # applied afterwards and filtered by last_updated.
+            self._load(self._resync())
+            self._live.set()
+            logger.info(f"Zustands-Cache synchronisiert ({len(self._entities)} Thermostate)")
+
+            while not self._stopping.is_set():
+                try:
+                    raw = ws.recv()
+                except websocket.WebSocketTimeoutException:
+                    self._send(ws, {"type": "ping"})
+                    continue
+                if not raw:
+                    raise RuntimeError("Verbindung vom Server geschlossen")
+                # Cheap pre-filter: skip decoding events of other domains
+                if "climate." not in raw:
+                    continue
+                self._handle(json_backend.loads(raw))
+        finally:
+            self._live.clear()
+            ws.close()
+
+    def _load(self, entities):
+        if entities is None:
+            raise RuntimeError("Vollständiger Abgleich fehlgeschlagen")
+        with self._lock:
+            self._entities = {e["entity_id"]: e for e in entities}
+
+    def _handle(self, msg):
+        if msg.get("type") != "event":
+            return
+        data = msg.get("event", {}).get("data", {})
+        entity_id = data.get("entity_id", "")
+        if not entity_id.startswith("climate."):
+            return
+        new_state = data.get("new_state")
+        with self._lock:
+            if new_state is None:
+                self._entities.pop(entity_id, None)
+                entity = None
+            else:
+                entity = self._convert(new_state)
+                current = self._entities.get(entity_id)
+                # Events queued during a resync may be older than the fetched state
+                if current and (current.get("last_updated") or "") > (entity.get("last_updated") or ""):
+                    return
+                self._entities[entity_id] = entity
+        if self._listener is not None:
+            if entity is None:
+                self._listener([], [entity_id])
+            else:
+                self._listener([entity], [])
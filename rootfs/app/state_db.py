@@ -0,0 +1,242 @@
+"""SQLite-backed storage of original temperatures and applied actions."""
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+SCHEMA_VERSION = 1
+
+# History older than the retention is pruned at startup and then at most
+# this often (seconds), when actions are recorded
+PRUNE_INTERVAL = 3600
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS originals (
+    entity_id TEXT PRIMARY KEY,
+    temperature REAL NOT NULL,
+    saved_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS originals_history (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    entity_id TEXT NOT NULL,
+    temperature REAL,
+    changed_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_originals_history_entity
+    ON originals_history (entity_id, changed_at);
+CREATE TABLE IF NOT EXISTS actions (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,
+    params TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_actions_created ON actions (created_at);
+CREATE TABLE IF NOT EXISTS action_results (
+    action_id INTEGER NOT NULL REFERENCES actions (id) ON DELETE CASCADE,
+    entity_id TEXT NOT NULL,
+    temperature REAL,
+    success INTEGER NOT NULL,
+    error TEXT,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_action_results_entity
+    ON action_results (entity_id, created_at);
+CREATE INDEX IF NOT EXISTS idx_action_results_action ON action_results (action_id);
+"""
+
+
+class StateDatabase:
+    """Store originals and action history in an embedded SQLite database.
+
+    Offers the same ``load``/``modify``/``delete`` interface as
+    ``OriginalsStore``, but persists changes as row upserts and deletes
+    instead of rewriting a whole file. The originals are mirrored in memory,
+    since this process is the only writer.
+
+    On first start, an existing JSON originals file at ``legacy_json_path``
+    is imported and renamed to ``*.migrated``.
+    """
+
+    def __init__(self, path, on_change=None, legacy_json_path=None, retention_days=90):
+        self.path = path
+        self._on_change = on_change
+        self._lock = threading.RLock()
+        self.generation = 0
+        self.retention_days = retention_days
+        self._pruned_at = 0.0
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA foreign_keys=ON")
+        self._migrate(legacy_json_path)
+        self._prune()
+
+        self._originals = {
+            row["entity_id"]: row["temperature"]
+            for row in self._conn.execute("SELECT entity_id, temperature FROM originals")
+        }
+
+    @contextmanager
+    def _transaction(self):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._conn
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    def _migrate(self, legacy_json_path):
+        version = self._conn.execute("PRAGMA user_version").fetchone()[0]
+        if version >= SCHEMA_VERSION:
+            return
+        # executescript commits implicitly, so it runs outside _transaction()
+        self._conn.executescript(SCHEMA)
+
+        if legacy_json_path and os.path.exists(legacy_json_path):
+            with open(legacy_json_path, "r") as f:
+                legacy = json.load(f)
+            now = time.time()
+            with self._transaction() as conn:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO originals (entity_id, temperature, saved_at) VALUES (?, ?, ?)",
+                    [(eid, temp, now) for eid, temp in legacy.items()],
+                )
+                conn.executemany(
+                    "INSERT INTO originals_history (entity_id, temperature, changed_at) VALUES (?, ?, ?)",
+                    [(eid, temp, now) for eid, temp in legacy.items()],
+                )
+            os.replace(legacy_json_path, legacy_json_path + ".migrated")
+            logger.info(f"{len(legacy)} Originaltemperaturen aus {legacy_json_path} übernommen")
+
+        self._conn.execute(f"PRAGMA user_version={SCHEMA_VERSION}")
+
+    def _prune(self):
+        now = time.time()
+        cutoff = now - self.retention_days * 86400
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM actions WHERE created_at < ?", (cutoff,))
+            conn.execute("DELETE FROM originals_history WHERE changed_at < ?", (cutoff,))
+        self._pruned_at = now
+
+    def load(self):
+        """Return a copy of the saved originals, or None if none are saved."""
+        with self._lock:
+            return dict(self._originals) if self._originals else None
+
+    @contextmanager
+    def modify(self):
+        """Yield a mutable copy of the originals and persist the difference on exit."""
+        with self._lock:
+            originals = dict(self._originals)
+            yield originals
+            upserts = [
+                (eid, temp) for eid, temp in originals.items()
+                if self._originals.get(eid) != temp
+            ]
+            removed = [eid for eid in self._originals if eid not in originals]
+            if not upserts and not removed:
+                return
+
+            now = time.time()
+            with self._transaction() as conn:
+                conn.executemany(
+                    "INSERT INTO originals (entity_id, temperature, saved_at) VALUES (?, ?, ?) "
+                    "ON CONFLICT (entity_id) DO UPDATE SET "
+                    "temperature = excluded.temperature, saved_at = excluded.saved_at",
+                    [(eid, temp, now) for eid, temp in upserts],
+                )
+                conn.executemany(
+                    "DELETE FROM originals WHERE entity_id = ?",
+                    [(eid,) for eid in removed],
+                )
+                conn.executemany(
+                    "INSERT INTO originals_history (entity_id, temperature, changed_at) VALUES (?, ?, ?)",
+                    [(eid, temp, now) for eid, temp in upserts] + [(eid, None, now) for eid in removed],
+                )
+            self._originals = originals
+            self.generation += 1
+            snapshot = dict(originals) if originals else None
+        if self._on_change is not None:
+            self._on_change(snapshot)
+
+    def delete(self):
+        """Remove all saved originals."""
+        with self.modify() as originals:
+            originals.clear()
+
+    def record_action(self, kind, params, outcomes):
+        """Record an applied action and its per-entity outcomes.
+
+        ``outcomes`` maps entity_id to ``(temperature, error)``, with error
+        None on success.
+        """
+        now = time.time()
+        with self._transaction() as conn:
+            cur = conn.execute(
+                "INSERT INTO actions (kind, params, created_at) VALUES (?, ?, ?)",
+                (kind, json.dumps(params), now),
+            )
+            action_id = cur.lastrowid
+            conn.executemany(
+                "INSERT INTO action_results "
+                "(action_id, entity_id, temperature, success, error, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                [
+                    (action_id, eid, temp, error is None, error, now)
+                    for eid, (temp, error) in outcomes.items()
+                ],
+            )
+        if now - self._pruned_at >= PRUNE_INTERVAL:
+            self._prune()
+        return action_id
+
+    def history(self, entity_id=None, since=None, limit=100):
+        """Return recorded per-entity outcomes, newest first."""
+        query = (
+            "SELECT a.id AS action_id, a.kind, a.params, r.entity_id, r.temperature, "
+            "r.success, r.error, r.created_at "
+            "FROM action_results r JOIN actions a ON a.id = r.action_id"
+        )
+        clauses = []
+        args = []
+        if entity_id:
+            clauses.append("r.entity_id = ?")
+            args.append(entity_id)
+        if since is not None:
+            clauses.append("r.created_at >= ?")
+            args.append(since)
+        if clauses:
+            query += " WHERE " + " AND ".join(clauses)
+        query += " ORDER BY r.created_at DESC LIMIT ?"
+        args.append(limit)
+
+        with self._lock:
+            rows = self._conn.execute(query, args).fetchall()
+        return [
+            {
+                "action_id": row["action_id"],
+                "kind": row["kind"],
+                "params": json.loads(row["params"]),
+                "entity_id": row["entity_id"],
+                "temperature": row["temperature"],
+                "success": bool(row["success"]),
+                "error": row["error"],
+                "timestamp": row["created_at"],
+            }
+            for row in rows
+        ]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,70 @@
+"""Incremental extraction of climate entities from a /api/states response body."""
+
+import codecs
+import re
+
+import json_backend
+
+# Consumes everything up to the next brace or unterminated string: plain
+# characters and complete JSON strings (which may contain braces) alike.
+# Written as an unrolled loop, which the re engine runs much faster than
+# the equivalent alternation.
+_SKIP = re.compile(r'[^{}"]*(?:"[^"\\]*(?:\\.[^"\\]*)*"[^{}"]*)*')
+_SEPARATOR = re.compile(r"[\s,\[]*")
+# Home Assistant serialises entity_id as the first key of every state
+_CLIMATE_START = re.compile(r'\{\s*"entity_id"\s*:\s*"climate\.')
+
+
+def _object_end(buf, pos):
+    """Return the index after the JSON object starting at ``pos``.
+
+    Returns None if the object is not complete within ``buf`` yet.
+    """
+    depth = 0
+    end = len(buf)
+    while True:
+        pos = _SKIP.match(buf, pos).end()
+        if pos >= end:
+            return None
+        ch = buf[pos]
+        if ch == "{":
+            depth += 1
+        elif ch == "}":
+            depth -= 1
+            if depth == 0:
+                return pos + 1
+        else:
+            # A string that continues in the next chunk
+            return None
+        pos += 1
+
+
+def iter_climate_states(chunks):
+    """Yield the decoded ``climate.*`` state objects from a states array.
+
+    ``chunks`` is an iterable of bytes, e.g. ``response.iter_content()``.
+    Only climate entries are passed to the JSON decoder; all others are
+    skipped by scanning, so memory stays bounded by the chunk size plus the
+    largest single state object.
+    """
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    buf = ""
+    pos = 0
+    for chunk in chunks:
+        buf = buf[pos:] + decoder.decode(chunk)
+        pos = 0
+        while True:
+            pos = _SEPARATOR.match(buf, pos).end()
+            if pos >= len(buf) or buf[pos] != "{":
+                break
+            end = _object_end(buf, pos)
+            if end is None:
+                break
+            if _CLIMATE_START.match(buf, pos):
+                yield json_backend.loads(buf[pos:end])
+            elif buf.find('"climate.', pos, end) != -1:
+                # Unusual key order: decode to be sure
+                state = json_backend.loads(buf[pos:end])
+                if state.get("entity_id", "").startswith("climate."):
+                    yield state
+            pos = end
@@ -0,0 +1,108 @@
+"""Planning of bulk setpoint writes: targets, no-ops and originals to save."""
+
+# Home Assistant's default precision when an entity reports no step
+DEFAULT_TEMP_STEP = 0.1
+
+
+def round_to_step(temperature, step):
+    """Round a setpoint to the entity's step size, as the device would."""
+    return round(round(temperature / step) * step, 2)
+
+
+def final_setpoint(entity, temperature):
+    """The setpoint the entity ends up with: rounded to its step, then clamped to its limits."""
+    step = entity.get("target_temp_step") or DEFAULT_TEMP_STEP
+    return max(entity["min_temp"], min(entity["max_temp"], round_to_step(temperature, step)))
+
+
+def setpoint_matches(entity, temperature):
+    """Whether the entity's setpoint equals ``temperature`` at its step size."""
+    current = entity["target_temperature"]
+    if current is None:
+        return False
+    step = entity.get("target_temp_step") or DEFAULT_TEMP_STEP
+    return round_to_step(current, step) == round_to_step(temperature, step)
+
+
+def split_noop_targets(targets, entities_by_id, pending=None):
+    """Split (entity_id, temperature) pairs into real changes and no-ops.
+
+    A target is a no-op if the entity's current setpoint already equals it
+    after rounding both to the entity's step size. ``pending`` maps
+    entity_id to the setpoint of a write still on its way, which counts
+    instead of the observed one. Unknown entities are always treated as
+    changes.
+    """
+    changes = []
+    skipped = []
+    for entity_id, temperature in targets:
+        entity = entities_by_id.get(entity_id)
+        if entity is not None and pending and entity_id in pending:
+            entity = {**entity, "target_temperature": pending[entity_id]}
+        if entity is not None and setpoint_matches(entity, temperature):
+            skipped.append(entity_id)
+            continue
+        changes.append((entity_id, temperature))
+    return changes, skipped
+
+
+class WritePlan:
+    """Everything one bulk request needs, derived from a single state fetch.
+
+    ``entities`` and ``originals`` map entity_id to the fetched entity and
+    the saved original; ``targets`` are the (entity_id, temperature) writes
+    to dispatch, ``skipped`` the entities already at their target,
+    ``new_originals`` the current setpoints to save before writing and
+    ``fetch_errors`` the messages for requested entities that could not be
+    fetched.
+    """
+
+    def __init__(self, originals):
+        self.entities = {}
+        self.originals = originals or {}
+        self.targets = []
+        self.skipped = []
+        self.new_originals = {}
+        self.fetch_errors = []
+
+
+def plan_writes(entities, originals, target_for, pending=None):
+    """Plan the writes for ``entities`` in one pass.
+
+    ``target_for(entity)`` returns the requested setpoint, or None to leave
+    the entity alone. Setpoints are rounded to the entity's step size and
+    clamped to its limits (``final_setpoint``); every entity with a setpoint
+    gets its original saved unless one is already. A setpoint in
+    ``pending`` (writes still on their way) replaces the observed one for
+    the no-op check.
+    """
+    plan = WritePlan(originals)
+    by_id = plan.entities
+    saved = plan.originals
+    new_originals = plan.new_originals
+    add_target = plan.targets.append
+    add_skipped = plan.skipped.append
+    for entity in entities:
+        entity_id = entity["entity_id"]
+        by_id[entity_id] = entity
+        current = entity["target_temperature"]
+        if current is not None and entity_id not in saved:
+            new_originals[entity_id] = current
+        temperature = target_for(entity)
+        if temperature is None:
+            continue
+        # final_setpoint and setpoint_matches, inlined for the hot loop.
+        # Values two steps or more apart never round to the same setpoint,
+        # so most targets skip rounding the current one.
+        step = entity.get("target_temp_step") or DEFAULT_TEMP_STEP
+        temperature = round(round(temperature / step) * step, 2)
+        temperature = max(entity["min_temp"], min(entity["max_temp"], temperature))
+        if pending and entity_id in pending:
+            current = pending[entity_id]
+        if current is not None:
+            diff = abs(current - temperature)
+            if diff == 0 or (diff < 2 * step and round_to_step(current, step) == round_to_step(temperature, step)):
+                add_skipped(entity_id)
+                continue
+        add_target((entity_id, temperature))
+    return plan